@@ -1,17 +1,43 @@
+import json
 import re
-
-from mesh.constants import OK, RETURNING
-from mesh.exceptions import GoneError, NotFoundError
+from copy import deepcopy
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from cPickle import HIGHEST_PROTOCOL, dumps, loads
+from datetime import date, datetime, time
+from decimal import Decimal
+from hashlib import sha1
+from operator import itemgetter
+from zlib import crc32
+
+from mesh.constants import CONFLICT, INVALID, OK, RETURNING
+from mesh.exceptions import GoneError, NotFoundError, RequestError
 from mesh.standard import Controller
-from sqlalchemy.sql import asc, column, desc, func, literal_column, not_, select
+from sqlalchemy import orm
+from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.orm import load_only
+from sqlalchemy.orm.attributes import instance_state
+from sqlalchemy.sql import and_, asc, desc, false, func, not_, or_
 
 from spire.core import Configurable, Unit
-from spire.schema import NoResultFound
+from spire.exceptions import ConfigurationError
+from spire.mesh.units import get_mesh_context
+from spire.support.coalescing import BatchLoader, SingleFlight
+from spire.schema import (IntegrityError, NoResultFound, OperationError, SearchMatch,
+    SimilarMatch, ValidationError)
 
 __all__ = ('ModelController', 'ProxyController', 'UnitController', 'support_returning')
 
 EMPTY = []
 
+EAGER_LOADERS = {
+    'joined': 'joinedload',
+    'selectin': ('selectinload' if hasattr(orm, 'selectinload') else 'subqueryload'),
+    'subquery': 'subqueryload',
+}
+
+UNCOUNTED_PARAMETERS = ('cursor', 'exclude', 'fields', 'include', 'limit', 'offset', 'sort',
+    'total_strategy')
+
 class FieldFilter(object):
     def __init__(self, controller, data):
         if not data:
@@ -30,68 +56,202 @@ class FieldFilter(object):
     def __contains__(self, field):
         return (field in self.fields)
 
+    @property
+    def key(self):
+        try:
+            return self._key
+        except AttributeError:
+            self._key = frozenset(self.fields)
+            return self._key
+
+def filter_op(predicate):
+    def constructor(self, query, column, value):
+        return query.filter(getattr(self, predicate)(column, value))
+    constructor.predicate = predicate
+    return constructor
+
 class FilterOperators(object):
+    """The filter operators available to a model controller. Each operator is
+    implemented by an ``<operator>_op`` method which filters a query; operators
+    which reduce to a single predicate also provide an ``<operator>_expr`` method
+    returning it, so that predicates can be combined into one filter."""
+
     WILDCARD_EXPR = re.compile(r'([%_])')
 
-    def equal_op(self, query, column, value):
-        return query.filter(column == value)
+    def get_predicate(self, operator):
+        """Returns the predicate method for ``operator``, or ``None`` if the operator
+        must be applied to the query as a whole."""
 
-    def iequal_op(self, query, column, value):
-        return query.filter(func.lower(column) == value)
+        constructor = getattr(self, operator + '_op')
+        predicate = getattr(constructor, 'predicate', None)
+        if predicate:
+            return getattr(self, predicate)
 
-    def not_op(self, query, column, value):
-        return query.filter(column != value)
+    def equal_expr(self, column, value):
+        return (column == value)
 
-    def inot_op(self, query, column, value):
-        return query.filter(func.lower(column) != value)
+    def iequal_expr(self, column, value):
+        return (func.lower(column) == value)
 
-    def prefix_op(self, query, column, value):
+    def not_expr(self, column, value):
+        return (column != value)
+
+    def inot_expr(self, column, value):
+        return (func.lower(column) != value)
+
+    def prefix_expr(self, column, value):
         value = self.WILDCARD_EXPR.sub(r'\\\1', value)
-        return query.filter(column.like(value + '%'))
+        return column.like(value + '%')
 
-    def iprefix_op(self, query, column, value):
+    def iprefix_expr(self, column, value):
         value = self.WILDCARD_EXPR.sub(r'\\\1', value)
-        return query.filter(column.ilike(value + '%'))
+        return column.ilike(value + '%')
 
-    def suffix_op(self, query, column, value):
+    def suffix_expr(self, column, value):
         value = self.WILDCARD_EXPR.sub(r'\\\1', value)
-        return query.filter(column.like('%' + value))
+        return column.like('%' + value)
 
-    def isuffix_op(self, query, column, value):
+    def isuffix_expr(self, column, value):
         value = self.WILDCARD_EXPR.sub(r'\\\1', value)
-        return query.filter(column.ilike('%' + value))
+        return column.ilike('%' + value)
 
-    def contains_op(self, query, column, value):
+    def contains_expr(self, column, value):
         value = self.WILDCARD_EXPR.sub(r'\\\1', value)
-        return query.filter(column.like('%' + value + '%'))
+        return column.like('%' + value + '%')
 
-    def icontains_op(self, query, column, value):
+    def icontains_expr(self, column, value):
         value = self.WILDCARD_EXPR.sub(r'\\\1', value)
-        return query.filter(column.ilike('%' + value + '%'))
+        return column.ilike('%' + value + '%')
 
-    def gt_op(self, query, column, value):
-        return query.filter(column > value)
+    def gt_expr(self, column, value):
+        return (column > value)
 
-    def gte_op(self, query, column, value):
-        return query.filter(column >= value)
+    def gte_expr(self, column, value):
+        return (column >= value)
 
-    def lt_op(self, query, column, value):
-        return query.filter(column < value)
+    def lt_expr(self, column, value):
+        return (column < value)
 
-    def lte_op(self, query, column, value):
-        return query.filter(column <= value)
+    def lte_expr(self, column, value):
+        return (column <= value)
 
-    def null_op(self, query, column, value):
+    def null_expr(self, column, value):
         if value:
-            return query.filter(column == None)
+            return (column == None)
         else:
-            return query.filter(column != None)
+            return (column != None)
+
+    def in_expr(self, column, value):
+        return column.in_(value)
+
+    def notin_expr(self, column, value):
+        return not_(column.in_(value))
+
+    def search_expr(self, column, value):
+        return SearchMatch(column, value)
+
+    def similar_expr(self, column, value):
+        return SimilarMatch(column, value)
+
+    equal_op = filter_op('equal_expr')
+    iequal_op = filter_op('iequal_expr')
+    not_op = filter_op('not_expr')
+    inot_op = filter_op('inot_expr')
+    prefix_op = filter_op('prefix_expr')
+    iprefix_op = filter_op('iprefix_expr')
+    suffix_op = filter_op('suffix_expr')
+    isuffix_op = filter_op('isuffix_expr')
+    contains_op = filter_op('contains_expr')
+    icontains_op = filter_op('icontains_expr')
+    gt_op = filter_op('gt_expr')
+    gte_op = filter_op('gte_expr')
+    lt_op = filter_op('lt_expr')
+    lte_op = filter_op('lte_expr')
+    null_op = filter_op('null_expr')
+    in_op = filter_op('in_expr')
+    notin_op = filter_op('notin_expr')
+    search_op = filter_op('search_expr')
+    similar_op = filter_op('similar_expr')
+
+CURSOR_TYPES = {
+    'date': lambda value: datetime.strptime(value, '%Y-%m-%d').date(),
+    'datetime': lambda value: datetime.strptime(value, '%Y-%m-%dT%H:%M:%S.%f'),
+    'decimal': Decimal,
+    'time': lambda value: datetime.strptime(value, '%H:%M:%S.%f').time(),
+}
+
+def decode_cursor(cursor, length):
+    """Decodes a continuation token produced by ``encode_cursor``, which should
+    contain ``length`` values."""
+
+    def decode_value(value):
+        if isinstance(value, dict):
+            return CURSOR_TYPES[value['type']](value['value'])
+        return value
+
+    try:
+        values = [decode_value(value) for value in json.loads(urlsafe_b64decode(str(cursor)))]
+    except Exception:
+        values = None
+
+    if values is None or len(values) != length:
+        raise ValidationError(token='invalid', title='invalid value',
+            message='the specified cursor is invalid')
+    return values
+
+def encode_cursor(values):
+    """Encodes the sort key values of a row as an opaque continuation token."""
+
+    def encode_value(value):
+        if isinstance(value, datetime):
+            return {'type': 'datetime', 'value': value.strftime('%Y-%m-%dT%H:%M:%S.%f')}
+        elif isinstance(value, date):
+            return {'type': 'date', 'value': value.isoformat()}
+        elif isinstance(value, time):
+            return {'type': 'time', 'value': value.strftime('%H:%M:%S.%f')}
+        elif isinstance(value, Decimal):
+            return {'type': 'decimal', 'value': str(value)}
+        raise TypeError(value)
+
+    return urlsafe_b64encode(json.dumps(values, default=encode_value))
+
+class ResourceExtractor(object):
+    """Extracts the values of the mapped attributes of a model instance which
+    correspond to a particular set of fields.
+
+    Loaded column values are read directly from the instance dict, bypassing
+    attribute instrumentation; when any attribute is not present there, because it
+    is unloaded or is not a column, every attribute is read normally instead."""
+
+    def __init__(self, mapping, fields):
+        pairs = sorted((name, attr) for name, attr in mapping.iteritems()
+            if name in fields and name != 'id')
+
+        self.names = tuple(name for name, attr in pairs)
+        self.attrs = tuple(attr for name, attr in pairs)
+        if pairs:
+            self.getter = itemgetter(*self.attrs)
+
+    def __call__(self, instance, resource):
+        names = self.names
+        if not names:
+            return resource
 
-    def in_op(self, query, column, value):
-        return query.filter(column.in_(value))
+        try:
+            values = self.getter(instance.__dict__)
+        except (AttributeError, KeyError):
+            for name, attr in zip(names, self.attrs):
+                try:
+                    resource[name] = getattr(instance, attr)
+                except AttributeError:
+                    pass
+            return resource
 
-    def notin_op(self, query, column, value):
-        return query.filter(not_(column.in_(value)))
+        if len(names) == 1:
+            resource[names[0]] = values
+        else:
+            resource.update(zip(names, values))
+        return resource
 
 def parse_attr_mapping(mapping):
     if isinstance(mapping, basestring):
@@ -109,18 +269,40 @@ def parse_attr_mapping(mapping):
 class ModelController(Unit, Controller):
     """A mesh controller for spire.schema models."""
 
+    MAXIMUM_EXTRACTORS = 256
+
     default_fields = None
+    eager_loading = None
     schema = None
     mapping = None
     model = None
     polymorphic_mapping = None
     polymorphic_on = None
     operators = FilterOperators()
+    entity_cache = None
+    entity_cache_generations = 1024
+    entity_cache_timeout = None
+    entity_version_attr = None
+    keyset_pagination = False
+    project_fields = False
+    result_cache = None
+    result_cache_timeout = None
+    _extractors = {}
+    _field_filter = (None, None)
+    _filter_plans = {}
+    stream_batch_size = None
+    total_cache = None
+    total_cache_timeout = None
+    total_estimate_threshold = 1000
+    total_strategies = None
+    total_strategy = 'exact'
 
     @classmethod
     def __construct__(cls):
         Controller.__construct__()
         if cls.resource:
+            cls._extractors = {}
+            cls._filter_plans = {}
             cls._composite_key = cls.resource.composite_key
             cls._id_field = cls.resource.id_field.name
 
@@ -137,6 +319,8 @@ class ModelController(Unit, Controller):
             if mapping:
                 for identity, submapping in mapping.items():
                     mapping[identity] = parse_attr_mapping(submapping)
+                if cls.eager_loading:
+                    cls.eager_loading = cls._resolve_polymorphic_eager_loading(mapping)
             else:
                 mapping = cls.mapping
                 if mapping is None:
@@ -150,23 +334,73 @@ class ModelController(Unit, Controller):
             except Exception:
                 return None
 
+        if self.entity_cache:
+            return self._acquire_cached_entity(subject)
+
         try:
             return self.schema.session.query(self.model).get(subject)
         except NoResultFound:
             return None
 
+    def batch(self, request, response, subject, data):
+        """Applies a sequence of create, update and delete operations within a single
+        transaction, responding with a result for each operation. When ``savepoints``
+        is true, each operation is applied within a savepoint, so that the failure of
+        one operation is reported in its result without aborting the others;
+        otherwise, the first failure aborts the entire batch."""
+
+        session = self.schema.session
+        savepoints = data.get('savepoints', False)
+
+        applied, invalidated = [], []
+        for operation in data['operations']:
+            if savepoints:
+                session.begin_nested()
+            try:
+                instance, returning, content = self._apply_operation(request, operation)
+                if savepoints:
+                    session.flush()
+            except Exception, exception:
+                session.rollback()
+                result = self._construct_batch_error(exception)
+                if not (savepoints and result):
+                    raise
+                applied.append((None, None, result))
+                continue
+
+            if savepoints:
+                session.commit()
+            if operation['operation'] != 'create':
+                invalidated.append(instance)
+            applied.append((instance, returning, {'status': OK, 'content': content}))
+
+        try:
+            session.flush()
+        except Exception:
+            session.rollback()
+            raise
+
+        results = []
+        for instance, returning, result in applied:
+            if instance is not None and result['content'] is None:
+                result['content'] = self._construct_returning(instance, returning)
+            results.append(result)
+
+        self._invalidate_caches(session, invalidated)
+        session.commit()
+        response(results)
+
     def create(self, request, response, subject, data):
         returning = data.pop(RETURNING, None)
-        instance = self.model.polymorphic_create(self._construct_model(data))
-
-        self._annotate_model(request, instance, data)
-        self.schema.session.add(instance)
+        instance = self._create_instance(request, data)
 
+        self._invalidate_caches(self.schema.session)
         self.schema.session.commit()
         response(self._construct_returning(instance, returning))
 
     def delete(self, request, response, subject, data):
         subject.session.delete(subject)
+        self._invalidate_caches(subject.session, [subject])
         subject.session.commit()
         response({'id': self._get_id_value(subject)})
 
@@ -178,31 +412,13 @@ class ModelController(Unit, Controller):
         if not candidates:
             return response([])
 
-        identifiers = []
-        for i, identifier in enumerate(candidates):
-            identifiers.append("(%d, '%s')" % (i, str(identifier)))
-
-        expr = select([column('rank'), column('id')],
-            from_obj="(values %s) as subset(rank, id)" % ', '.join(identifiers))
-
-        query = (self.schema.session.query(self.model)
-            .join(expr.cte('__subset__'), literal_column('__subset__.id')==self.model.id)
-            .order_by(literal_column('__subset__.rank')))
+        instances = self._load_instances(candidates, self._get_field_filter(data))
 
         resources = []
-        instances = list(query.all())
-
-        instance = (instances.pop(0) if instances else None)
         for id in candidates:
-            if instance:
-                if instance.id == id:
-                    resources.append(self._construct_resource(request, instance, data))
-                    if instances:
-                        instance = instances.pop(0)
-                    else:
-                        instance = None
-                else:
-                    resources.append(None)
+            instance = instances.get(id)
+            if instance is not None:
+                resources.append(self._construct_resource(request, instance, data))
             else:
                 resources.append(None)
 
@@ -217,40 +433,90 @@ class ModelController(Unit, Controller):
 
     def query(self, request, response, subject, data):
         data = data or {}
-        query = self.schema.session.query(self.model)
-
-        filters = data.get('query')
-        if filters:
-            query = self._construct_filters(query, filters)
-
-        query = self._annotate_query(request, query, data)
-
-        total = query.count()
-        if data.get('total'):
-            return response({'total': total})
-
-        if 'sort' in data:
-            query = self._construct_sorting(query, data['sort'])
-        if 'limit' in data:
-            query = query.limit(data['limit'])
-        if 'offset' in data:
-            query = query.offset(data['offset'])
-
-        resources = []
-        for instance in query.all():
-            resources.append(self._construct_resource(request, instance, data))
-
-        response({'total': total, 'resources': resources})
+        cache = self.result_cache
+        if not cache:
+            return response(self._construct_query_response(request, data))
+
+        # results are cached serialized, so that no two responses ever share content
+        # which may be modified while the response is processed
+        key = self._construct_cache_key(request, 'query', data)
+        content = cache.get(key)
+        if content is None:
+            content = self._construct_query_response(request, data)
+            cache.set(key, dumps(content, HIGHEST_PROTOCOL), self.result_cache_timeout)
+        else:
+            content = loads(content)
+        response(content)
 
     def update(self, request, response, subject, data):
         returning = data.pop(RETURNING, None)
         if data:
-            subject.update_with_mapping(self._construct_model(data))
-            self._annotate_model(request, subject, data)
+            self._update_instance(request, subject, data)
+            self._invalidate_caches(subject.session, [subject])
             subject.session.commit()
 
         response(self._construct_returning(subject, returning))
 
+    def _acquire_cached_entity(self, subject):
+        """Acquires the instance identified by ``subject`` from the entity cache, which
+        holds a pickled, detached copy of each instance recently acquired. Each copy
+        is tagged with the generation of its entity as read before the instance was
+        loaded, so that a copy loaded before a concurrent change was committed is never
+        used once that change invalidates the entity. When ``entity_version_attr`` is
+        set, a cached copy is additionally only used if its version matches the version
+        currently stored."""
+
+        session = self.schema.session
+        identity = self.model.__mapper__.identity_key_from_primary_key(
+            subject if isinstance(subject, list) else [subject])
+
+        instance = session.identity_map.get(identity)
+        if instance is not None:
+            return instance
+
+        cache = self.entity_cache
+        key = self._construct_entity_key(identity)
+        generation = cache.get_generation(self._get_entity_generation_namespace(key))
+
+        entry = cache.get(key)
+        if entry is not None:
+            if entry[0] == generation:
+                instance = session.merge(loads(entry[1]), load=False)
+                if self._is_entity_current(session, instance, identity):
+                    return instance
+                session.expunge(instance)
+            cache.delete(key)
+
+        try:
+            instance = session.query(self.model).get(subject)
+        except NoResultFound:
+            return None
+
+        if instance is not None:
+            cache.set(key, (generation, dumps(instance, HIGHEST_PROTOCOL)),
+                self.entity_cache_timeout)
+        return instance
+
+    def _apply_operation(self, request, operation):
+        name, data = operation['operation'], operation.get('data') or {}
+        returning = data.pop(RETURNING, None)
+        if name == 'create':
+            return self._create_instance(request, data), returning, None
+
+        subject = self.acquire(operation['subject'])
+        if subject is None:
+            raise NotFoundError()
+
+        if name == 'update':
+            if data:
+                self._update_instance(request, subject, data)
+            return subject, returning, None
+        elif name == 'delete':
+            subject.session.delete(subject)
+            return subject, None, {'id': self._get_id_value(subject)}
+        else:
+            raise ValueError('invalid operation %r' % name)
+
     def _annotate_filter(self, query, filter, value):
         pass
 
@@ -263,29 +529,226 @@ class ModelController(Unit, Controller):
     def _annotate_query(self, request, query, data):
         return query
 
-    def _construct_filters(self, query, filters):
-        model = self.model
-        mapping = self._get_mapping(model)
-        operators = self.operators
+    def _construct_batch_error(self, exception):
+        if isinstance(exception, RequestError):
+            return {'status': exception.status, 'content': exception.content}
+        elif isinstance(exception, (OperationError, ValidationError)):
+            return {'status': INVALID, 'content': exception.serialize()}
+        elif isinstance(exception, IntegrityError):
+            return {'status': CONFLICT, 'content': None}
+        elif isinstance(exception, ValueError):
+            return {'status': INVALID, 'content': None}
+
+    def _construct_cache_key(self, request, operation, data, cache=None):
+        """Constructs the key under which the results of ``operation`` are cached.
+        The key includes the request context, so controllers which scope results by
+        anything other than the request data and context must extend it."""
+
+        resource = self.resource
+        generation = (cache or self.result_cache).get_generation(self._get_cache_namespace())
+
+        parameters = json.dumps([getattr(request, 'context', None), data], sort_keys=True,
+            default=repr)
+        return '%s:%s:%s:%s:%s' % (operation, resource.name, resource.version, generation,
+            sha1(parameters).hexdigest())
+
+    def _construct_query_response(self, request, data):
+        query = self.schema.session.query(self.model)
+
+        filters = data.get('query')
+        if filters:
+            query = self._construct_filters(query, filters)
+
+        query = self._annotate_query(request, query, data)
+        if data.get('total'):
+            return {'total': query.count()}
+
+        # keyset pagination seeks past the last row of the previous page, identified by
+        # the cursor, instead of skipping rows with an offset
+        keyset = self.keyset_pagination and not data.get('offset')
+
+        # a window over a page following a cursor would only count the rows which follow
+        # the cursor, so such pages are counted before seeking instead
+        strategy = self._get_total_strategy(data)
+        if strategy == 'window' and keyset and data.get('cursor'):
+            strategy = 'exact'
+
+        if strategy in ('window', 'none'):
+            counted, total = query, None
+        else:
+            total = self._construct_total(request, query, data, strategy)
+
+        if keyset:
+            query = self._construct_sorting(query, data.get('sort') or EMPTY,
+                data.get('cursor'), True)
+        elif 'sort' in data:
+            query = self._construct_sorting(query, data['sort'])
+        if 'limit' in data:
+            query = query.limit(data['limit'])
+        if data.get('offset'):
+            query = query.offset(data['offset'])
+
+        # joining collections would both count joined rows within the window and split
+        # the rows of one instance across batches when streaming
+        batch_size = self.stream_batch_size
+        collections = not (batch_size or strategy == 'window')
 
-        for filter, value in filters.iteritems():
-            annotation = self._annotate_filter(query, filter, value)
-            if annotation:
-                query = annotation
+        fields = self._get_field_filter(data)
+        query = self._construct_eager_loading(self._construct_projection(query, fields), fields,
+            collections)
+
+        # the window is evaluated before limit and offset are applied, so every row
+        # carries the total for the entire filtered query
+        if strategy == 'window':
+            query = query.add_columns(func.count().over())
+
+        if batch_size:
+            query = self.schema.dialect.stream_query(query, batch_size)
+
+        resources, instance = [], None
+        for instance in query:
+            if strategy == 'window':
+                instance, total = instance
+            resources.append(self._construct_resource(request, instance, data))
+
+        if strategy == 'window' and total is None:
+            total = (counted.count() if data.get('offset') or 'limit' in data else 0)
+
+        content = {'resources': resources}
+        if total is not None:
+            content['total'] = total
+        if keyset and instance is not None and len(resources) == data.get('limit'):
+            content['cursor'] = encode_cursor([getattr(instance, attr) for attr, column, descending
+                in self._parse_sorting(data.get('sort') or EMPTY, True)])
+        return content
+
+    def _construct_total(self, request, query, data, strategy):
+        """Counts the rows matched by ``query`` using ``strategy``: ``exact`` counts
+        them, ``cached`` reuses an exact count made for the same query within the
+        last ``total_cache_timeout`` seconds, and ``estimated`` uses the estimate of
+        the query planner when the dialect supports one, counting exactly when the
+        estimate falls below ``total_estimate_threshold``."""
+
+        if strategy == 'estimated':
+            total = self.schema.dialect.estimate_count(self.schema.session, query)
+            if total is not None and total >= self.total_estimate_threshold:
+                return total
+            return query.count()
+
+        cache = self.total_cache or self.result_cache
+        if strategy != 'cached' or not cache:
+            return query.count()
+
+        # the key covers all of the request data which might shape the query, as
+        # _annotate_query may consult any of it, excluding only the parameters which
+        # page, order or project its results
+        parameters = dict((name, value) for name, value in data.iteritems()
+            if name not in UNCOUNTED_PARAMETERS)
+
+        key = self._construct_cache_key(request, 'total', parameters, cache)
+        total = cache.get(key)
+        if total is None:
+            total = query.count()
+            cache.set(key, total, self.total_cache_timeout)
+        return total
+
+    def _construct_eager_loading(self, query, fields, collections=True):
+        """Eagerly loads the relationships declared by ``eager_loading`` for the fields
+        in ``fields``, so that they are not loaded individually for each instance.
+        ``eager_loading`` maps a field either to a strategy, if the field is mapped to
+        a relationship, or to a ``(path, strategy)`` pair, where ``path`` is a dotted
+        path of relationships. The strategy is one of ``joined``, ``subquery`` or
+        ``selectin``; the latter falls back to ``subquery`` when not supported. When
+        ``collections`` is false, collections are never joined to ``query`` itself,
+        so those declared as ``joined`` are loaded as ``subquery`` instead."""
+
+        declarations = self.eager_loading
+        if not declarations:
+            return query
+
+        options = []
+        for name, declaration in declarations.iteritems():
+            if name not in fields:
                 continue
 
-            attr, operator = filter, 'equal'
-            if '__' in filter:
-                attr, operator = filter.rsplit('__', 1)
+            if isinstance(declaration, basestring):
+                path, strategy = self.mapping[name], declaration
+            else:
+                path, strategy = declaration
+
+            # options for a nested path are chained, so that each relationship along
+            # the path is loaded with the same strategy; once a collection is loaded by
+            # a subquery, the relationships beyond it are joined to that subquery instead
+            loader, function, mapper = orm, EAGER_LOADERS[strategy], self.model.__mapper__
+            restricted = (strategy == 'joined' and not collections)
+            for attr in path.split('.'):
+                if restricted:
+                    mapper, collection = self._inspect_relationship(mapper, attr)
+                    if collection:
+                        loader, restricted = loader.subqueryload(attr), False
+                        continue
+                loader = getattr(loader, function)(attr)
+            options.append(loader)
+
+        if options:
+            query = query.options(*options)
+        return query
 
-            column = getattr(model, mapping[attr])
-            if not column:
+    @classmethod
+    def _resolve_polymorphic_eager_loading(cls, mapping):
+        """Resolves each field of ``eager_loading`` declared only by its strategy to
+        the ``(path, strategy)`` form, since a polymorphic controller has no single
+        mapping; the field must be mapped to the same attribute for every identity."""
+
+        declarations = {}
+        for name, declaration in cls.eager_loading.iteritems():
+            if isinstance(declaration, basestring):
+                paths = set(submapping.get(name) for submapping in mapping.itervalues())
+                if len(paths) != 1 or None in paths:
+                    raise ConfigurationError('eager loading of %r on %s must be declared as'
+                        ' a (path, strategy) pair, since it is not mapped to the same attribute'
+                        ' for every polymorphic identity' % (name, cls.__name__))
+                declaration = (paths.pop(), declaration)
+            declarations[name] = declaration
+        return declarations
+
+    def _construct_entity_key(self, identity):
+        return 'entity:%s:%s' % (self._get_cache_namespace(),
+            ';'.join(str(value) for value in identity[1]))
+
+    def _construct_filters(self, query, filters):
+        annotated = (self._annotate_filter.im_func is not ModelController._annotate_filter.im_func)
+
+        predicates = []
+        for filter, column, predicate, constructor in self._get_filter_plan(filters):
+            value = filters[filter]
+            if annotated:
+                annotation = self._annotate_filter(query, filter, value)
+                if annotation:
+                    query = annotation
+                    continue
+
+            if constructor is None:
+                raise KeyError(filter)
+            if column is None:
                 continue
+            if predicate:
+                predicates.append(predicate(column, value))
+            else:
+                query = constructor(query, column, value)
 
-            constructor = getattr(operators, operator + '_op')
-            query = constructor(query, column, value)
+        if len(predicates) == 1:
+            return query.filter(predicates[0])
+        elif predicates:
+            return query.filter(and_(*predicates))
+        else:
+            return query
 
-        return query
+    def _create_instance(self, request, data):
+        instance = self.model.polymorphic_create(self._construct_model(data))
+        self._annotate_model(request, instance, data)
+        self.schema.session.add(instance)
+        return instance
 
     def _construct_model(self, data):
         mapping = self.mapping
@@ -301,17 +764,29 @@ class ModelController(Unit, Controller):
             del model['id']
         return model
 
+    def _construct_projection(self, query, fields):
+        """Restricts the columns loaded by ``query`` to those mapped to the fields in
+        ``fields``, when ``project_fields`` is enabled. Columns which are not loaded are
+        deferred, and so are loaded individually if later accessed."""
+
+        if not self.project_fields or self.polymorphic_on:
+            return query
+
+        mapper = self.model.__mapper__
+        columns = set(prop.key for prop in mapper.column_attrs)
+
+        attrs = set(mapper.get_property_by_column(column).key for column in mapper.primary_key)
+        for name, attr in self.mapping.iteritems():
+            if name in fields and attr in columns:
+                attrs.add(attr)
+
+        return query.options(load_only(*attrs))
+
     def _construct_resource(self, request, model, data, **resource):
-        mapping = self._get_mapping(model)
-        fields = FieldFilter(self, data)
+        extractor = self._get_extractor(model, self._get_field_filter(data))
 
         resource['id'] = self._get_id_value(model)
-        for name, attr in mapping.iteritems():
-            if name in fields and name != 'id':
-                try:
-                    resource[name] = getattr(model, attr)
-                except AttributeError:
-                    pass
+        extractor(model, resource)
 
         self._annotate_resource(request, model, resource, data)
         return resource
@@ -332,26 +807,237 @@ class ModelController(Unit, Controller):
                         pass
         return response
 
-    def _construct_sorting(self, query, sorting):
+    def _construct_sorting(self, query, sorting, cursor=None, keyset=False):
+        keys = self._parse_sorting(sorting, keyset)
+        if cursor:
+            values = decode_cursor(cursor, len(keys))
+
+            # each row following the cursor matches it on some leading subset of the keys
+            # and then follows it on the next key; null sorts after every other value, so
+            # a null is followed by nothing ascending and by every other value descending
+            clauses = []
+            for i, (attr, column, descending) in enumerate(keys):
+                value = values[i]
+                if descending:
+                    term = (column != None) if value is None else (column < value)
+                elif value is None:
+                    continue
+                else:
+                    term = column > value
+                    if self._is_nullable(column):
+                        term = or_(term, column == None)
+
+                terms = [keys[j][1] == values[j] for j in range(i)]
+                clauses.append(and_(*(terms + [term])))
+            query = query.filter(or_(*clauses) if clauses else false())
+
+        columns = []
+        for attr, column, descending in keys:
+            # databases disagree on where nulls sort, so keyset pagination orders them
+            # explicitly, consistently with the cursor predicates above
+            if keyset and self._is_nullable(column):
+                nulls = (column == None)
+                columns.append(desc(nulls) if descending else asc(nulls))
+            columns.append(desc(column) if descending else asc(column))
+        return query.order_by(*columns)
+
+    def _load_instances(self, identifiers, fields=None):
+        model, session = self.model, self.schema.session
+        mapper = model.__mapper__
+
+        # instances already present and unexpired within the session are used as is
+        instances, remaining = {}, []
+        for id in set(identifiers):
+            instance = session.identity_map.get(mapper.identity_key_from_primary_key([id]))
+            if instance is not None and not instance_state(instance).expired_attributes:
+                instances[id] = instance
+            else:
+                remaining.append(id)
+
+        if not remaining:
+            return instances
+
+        dialect = self.schema.dialect
+        size = dialect.membership_chunk_size or len(remaining)
+
+        query = session.query(model)
+        if fields is not None:
+            query = self._construct_eager_loading(self._construct_projection(query, fields),
+                fields)
+
+        for i in range(0, len(remaining), size):
+            criterion = dialect.construct_membership(model.id, remaining[i:i + size])
+            for instance in query.filter(criterion):
+                instances[instance.id] = instance
+
+        return instances
+
+    def _invalidate_caches(self, session, instances=EMPTY):
+        # cached results are invalidated only once the change is committed, so that
+        # they are never repopulated from the state preceding the commit
+        for cache in set([self.result_cache, self.total_cache]):
+            if cache:
+                session.call_after_commit(cache.advance_generation,
+                    self._get_cache_namespace())
+
+        cache = self.entity_cache
+        if cache:
+            for instance in instances:
+                identity = self.model.__mapper__.identity_key_from_instance(instance)
+                key = self._construct_entity_key(identity)
+                session.call_after_commit(cache.advance_generation,
+                    self._get_entity_generation_namespace(key))
+                session.call_after_commit(cache.delete, key)
+
+    def _is_entity_current(self, session, instance, identity):
+        attr = self.entity_version_attr
+        if not attr:
+            return True
+
+        mapper = self.model.__mapper__
+        criteria = [column == value for column, value in zip(mapper.primary_key, identity[1])]
+
+        row = session.query(getattr(self.model, attr)).filter(and_(*criteria)).first()
+        return row is not None and row[0] == getattr(instance, attr)
+
+    def _inspect_relationship(self, mapper, attr):
+        # a relationship which cannot be inspected is presumed to be a collection
+        try:
+            prop = mapper.get_property(attr)
+        except InvalidRequestError:
+            return None, True
+        return getattr(prop, 'mapper', None), getattr(prop, 'uselist', True)
+
+    def _is_nullable(self, column):
+        try:
+            return any(candidate.nullable for candidate in column.property.columns)
+        except AttributeError:
+            return True
+
+    def _parse_sorting(self, sorting, keyset=False):
         model = self.model
         mapping = self._get_mapping(model)
 
-        columns = []
+        keys = []
         for attr in sorting:
-            direction = asc
+            descending = False
             if attr[-1] == '+':
                 attr = attr[:-1]
             elif attr[-1] == '-':
                 attr = attr[:-1]
-                direction = desc
+                descending = True
 
             column = getattr(model, mapping[attr])
             if not column:
                 continue
 
-            columns.append(direction(column))
+            keys.append((mapping[attr], column, descending))
+
+        # keyset pagination requires a total ordering, so the identifier is appended
+        # to break any ties between rows
+        if keyset:
+            sorted_attrs = set(key[0] for key in keys)
+            for name in (self._composite_key or ['id']):
+                attr = mapping[name]
+                if attr not in sorted_attrs:
+                    keys.append((attr, getattr(model, attr), False))
+        return keys
+
+    def _update_instance(self, request, subject, data):
+        subject.update_with_mapping(self._construct_model(data))
+        self._annotate_model(request, subject, data)
+
+    def _get_cache_namespace(self):
+        return '%s:%s' % (self.model._spire_schema.name, self.model.__table__.name)
+
+    def _get_entity_generation_namespace(self, key):
+        # entities share a bounded number of generations, as generations are never
+        # evicted; entities sharing a generation are merely invalidated together
+        return 'entity:%s:%d' % (self._get_cache_namespace(),
+            (crc32(key) & 0xffffffff) % self.entity_cache_generations)
+
+    def _get_extractor(self, model, fields):
+        identity = None
+        if self.polymorphic_on:
+            identity = getattr(model, self.polymorphic_on[1])
 
-        return query.order_by(*columns)
+        key = (type(model), identity, fields.key)
+        try:
+            return self._extractors[key]
+        except KeyError:
+            pass
+
+        # the cache is keyed in part by caller-specified field sets, so is bounded
+        extractors = self._extractors
+        if len(extractors) >= self.MAXIMUM_EXTRACTORS:
+            extractors.clear()
+
+        extractor = extractors[key] = ResourceExtractor(self._get_mapping(model), fields)
+        return extractor
+
+    def _get_field_filter(self, data):
+        # each resource within a response is constructed from the same request data, so
+        # the filter constructed for the most recent request data is retained
+        candidate, fields = self._field_filter
+        if candidate is data and data is not None:
+            return fields
+
+        fields = FieldFilter(self, data)
+        self._field_filter = (data, fields)
+        return fields
+
+    def _get_filter_plan(self, filters):
+        """Returns the plan for applying ``filters``, which is compiled once for each
+        distinct set of filter keys: a sequence of ``(filter, column, predicate,
+        constructor)`` tuples, where ``predicate`` is ``None`` for operators which
+        must be applied to the query as a whole."""
+
+        key = frozenset(filters)
+        try:
+            return self._filter_plans[key]
+        except KeyError:
+            pass
+
+        model = self.model
+        mapping = self._get_mapping(model)
+        operators = self.operators
+
+        plan = []
+        for filter in sorted(key):
+            attr, operator = filter, 'equal'
+            if '__' in filter:
+                attr, operator = filter.rsplit('__', 1)
+
+            # filters which are neither mapped nor supported by an operator can still be
+            # handled by _annotate_filter, so are only rejected when applied
+            try:
+                column = getattr(model, mapping[attr]) or None
+                constructor = getattr(operators, operator + '_op')
+            except (AttributeError, KeyError):
+                plan.append((filter, None, None, None))
+            else:
+                plan.append((filter, column, operators.get_predicate(operator), constructor))
+
+        # like the extractor cache, this is keyed by caller-specified filter sets
+        plans = self._filter_plans
+        if len(plans) >= self.MAXIMUM_EXTRACTORS:
+            plans.clear()
+
+        plans[key] = plan
+        return plan
+
+    def _get_total_strategy(self, data):
+        strategy = data.get('total_strategy')
+        if strategy is None:
+            return self.total_strategy
+
+        strategies = self.total_strategies
+        if strategies is None:
+            strategies = ('cached', 'estimated', 'exact', 'none', 'window')
+        if strategy not in strategies:
+            raise ValidationError(token='invalid', title='invalid value',
+                message='the specified total strategy is not supported')
+        return strategy
 
     def _get_id_value(self, model):
         mapping = self._get_mapping(model)
@@ -378,9 +1064,25 @@ def support_returning(method):
     return wrapper
 
 class ProxyController(Unit, Controller):
-    """A mesh controller for mesh proxy models."""
+    """A mesh controller for mesh proxy models.
+
+    When ``coalesce_requests`` is enabled, concurrent identical acquisitions and
+    queries share a single upstream request. When ``batch_window`` is set, subjects
+    acquired within that many seconds of each other are fetched with a single upstream
+    ``load``. Requests are only shared by callers within the same mesh context, as the
+    context is propagated upstream and may scope the response. When ``response_cache``
+    is set to a cache, query responses are cached for ``response_cache_timeout``
+    seconds, and are invalidated by any change made through this controller."""
+
     proxy_model = None
     mapping = None
+    batch_size = 100
+    batch_window = None
+    coalesce_requests = False
+    response_cache = None
+    response_cache_timeout = 1
+    _batches = None
+    _flights = None
 
     @classmethod
     def __construct__(cls):
@@ -392,22 +1094,32 @@ class ProxyController(Unit, Controller):
             cls.mapping = parse_attr_mapping(mapping)
 
             cls.id_field = cls.resource.id_field
+            if cls.batch_window:
+                cls._batches = BatchLoader(cls.batch_window, cls.batch_size, deepcopy)
+            if cls.coalesce_requests:
+                cls._flights = SingleFlight(deepcopy)
 
     def acquire(self, subject):
-        try:
-            return self.proxy_model.get(subject)
-        except GoneError:
-            return None
+        if self._batches:
+            return self._batches.get(subject, self._load_proxy_models,
+                self._get_context_key())
+        elif self._flights:
+            return self._flights.call(('get', self._get_context_key(), subject),
+                self._get_proxy_model, subject)
+        else:
+            return self._get_proxy_model(subject)
 
     def create(self, request, response, subject, data):
         proxy_model = self._construct_proxy_model(data)
         self._annotate_proxy_model(request, proxy_model, data)
         subject = self.proxy_model.create(proxy_model)
+        self._invalidate_responses()
         id_field = self.id_field
         response({id_field: self._get_proxy_model_value(subject, id_field)})
 
     def delete(self, request, response, subject, data):
         subject.destroy()
+        self._invalidate_responses()
         id_field = self.id_field
         response({id_field: self._get_proxy_model_value(subject, id_field)})
 
@@ -428,6 +1140,46 @@ class ProxyController(Unit, Controller):
         if 'query' in data:
             data['query'] = self._construct_filter(data['query'])
 
+        cache, key = self.response_cache, None
+        if cache or self._flights:
+            key = self._construct_request_key(request, 'query', data)
+        if cache:
+            cached = cache.get(key)
+            if cached is not None:
+                status, content = loads(cached)
+                return response(status=status, content=content)
+
+        if self._flights:
+            status, content = self._flights.call(key, self._execute_query, request, data)
+        else:
+            status, content = self._execute_query(request, data)
+
+        # responses are cached serialized, so that no two responses share content
+        if cache:
+            cache.set(key, dumps((status, content), HIGHEST_PROTOCOL),
+                self.response_cache_timeout)
+        response(status=status, content=content)
+
+    def update(self, request, response, subject, data):
+        if data:
+            proxy_data = self._construct_proxy_model(data)
+            self._annotate_proxy_model(request, proxy_data, data)
+            subject.update(proxy_data)
+            self._invalidate_responses()
+        id_field = self.id_field
+        response({id_field: self._get_proxy_model_value(subject, id_field)})
+
+    def _construct_request_key(self, request, operation, data):
+        parameters = json.dumps([getattr(request, 'context', None), get_mesh_context(), data],
+            sort_keys=True, default=repr)
+
+        key = '%s:%s:%s' % (operation, self.resource.name, sha1(parameters).hexdigest())
+        cache = self.response_cache
+        if cache:
+            key = '%s:%s' % (cache.get_generation(self._get_cache_namespace()), key)
+        return key
+
+    def _execute_query(self, request, data):
         try:
             query_results = self.proxy_model.query(**data).all()
         except NotFoundError:
@@ -444,16 +1196,30 @@ class ProxyController(Unit, Controller):
             self._annotate_resource(request, resource, result, data)
             resources.append(self._prune_resource(resource, data))
 
-        response(status=status, 
-                 content={'resources': resources, 'total': total})
+        return status, {'resources': resources, 'total': total}
 
-    def update(self, request, response, subject, data):
-        if data:
-            proxy_data = self._construct_proxy_model(data)
-            self._annotate_proxy_model(request, proxy_data, data)
-            subject.update(proxy_data)
-        id_field = self.id_field
-        response({id_field: self._get_proxy_model_value(subject, id_field)})
+    def _get_cache_namespace(self):
+        return 'proxy:%s' % self.resource.name
+
+    def _get_context_key(self):
+        return json.dumps(get_mesh_context(), sort_keys=True, default=repr)
+
+    def _get_proxy_model(self, subject):
+        try:
+            return self.proxy_model.get(subject)
+        except GoneError:
+            return None
+
+    def _invalidate_responses(self):
+        if self.response_cache:
+            self.response_cache.advance_generation(self._get_cache_namespace())
+
+    def _load_proxy_models(self, identifiers):
+        """Fetches the proxy models identified by ``identifiers`` with a single upstream
+        ``load`` request, returning a dict mapping each identifier to its proxy model,
+        or to ``None`` if it does not exist."""
+
+        return dict(zip(identifiers, self.proxy_model.load(identifiers)))
 
     def _construct_filter(self, filters):
         mapping = self.mapping
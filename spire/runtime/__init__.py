@@ -1 +1,2 @@
-from spire.runtime.runtime import current_runtime, onstartup
+from spire.runtime.runtime import (current_runtime, onstartup, register_postfork,
+    register_shutdown)
@@ -30,6 +30,7 @@ class Runtime(Runtime):
 
         if configuration['detached']:
             detach_process()
+            self.run_postforks()
 
         self.pidfile = None
         if 'pidfile' in configuration:
@@ -39,4 +40,7 @@ class Runtime(Runtime):
         if 'uid' in configuration:
             switch_user(configuration['uid'], configuration.get('gid'))
 
-        self.daemon.run()
+        try:
+            self.daemon.run()
+        finally:
+            self.shutdown()
@@ -9,7 +9,8 @@ from scheme import *
 from spire.core import Assembly
 from spire.exceptions import TemporaryStartupError
 from spire.runtime.registration import ServiceEndpoint
-from spire.support.logs import LogHelper, configure_logging
+from spire.support.logs import (LogHelper, configure_logging, restart_queue_handlers,
+    stop_queue_handlers)
 from spire.util import (enumerate_tagged_methods, find_tagged_method,
     recursive_merge, topological_sort)
 
@@ -48,7 +49,9 @@ class Runtime(object):
         self.components = {}
         self.configuration = {}
         self.parameters = {}
+        self.postforks = []
         self.services = {}
+        self.shutdowns = []
 
         if configuration:
             self.configure(configuration)
@@ -119,6 +122,19 @@ class Runtime(object):
     def reload(self):
         pass
 
+    def run_postforks(self):
+        restart_queue_handlers()
+        for function in self.postforks:
+            function()
+
+    def shutdown(self):
+        for function in self.shutdowns:
+            try:
+                function()
+            except Exception:
+                log('exception', 'shutdown function %r raised exception', function)
+        stop_queue_handlers()
+
     def startup(self):
         if not self.parameters['startup_enabled']:
             log('warning', 'skipping startup of components')
@@ -236,6 +252,18 @@ class Runtime(object):
 def current_runtime():
     return Runtime.runtime
 
+def register_postfork(function):
+    runtime = Runtime.runtime
+    if runtime:
+        runtime.postforks.append(function)
+    return function
+
+def register_shutdown(function):
+    runtime = Runtime.runtime
+    if runtime:
+        runtime.shutdowns.append(function)
+    return function
+
 def onstartup(after=None, service=None, stage=None):
     if isinstance(after, basestring):
         after = after.split(' ') if after else None
@@ -41,9 +41,9 @@ class Runtime(Runtime):
     def __init__(self, configuration=None, assembly=None):
         super(Runtime, self).__init__(assembly=assembly)
         self.mules = {}
-        self.postforks = []
         self.signals = {}
 
+        uwsgi.atexit = self.shutdown
         uwsgi.post_fork_hook = self.run_postforks
 
         for key in ('yaml', 'yml', 'json'):
@@ -98,8 +98,7 @@ class Runtime(Runtime):
         uwsgi.add_file_monitor(IPYTHON_CONSOLE_SIGNAL, trigger)
 
     def register_mule(self, name, function):
-        mule = self.mules[name] = Mule(len(self.mules) + 1, name, function)
-        self.postforks.append(mule)
+        self.mules[name] = Mule(len(self.mules) + 1, name, function)
 
     def register_signal(self, name, target=None, function=None):
         id = len(self.signals) + 10
@@ -113,8 +112,9 @@ class Runtime(Runtime):
 
     def run_postforks(self):
         purge_context_locals()
-        for function in self.postforks:
-            function()
+        super(Runtime, self).run_postforks()
+        for mule in self.mules.values():
+            mule()
 
     def signal(self, name):
         uwsgi.signal(self.signals[name])
@@ -25,7 +25,10 @@ class Runtime(Runtime):
             }, cache=False)
 
         self.server = WsgiServer(address, self.dispatcher)
-        self.server.serve()
+        try:
+            self.server.serve()
+        finally:
+            self.shutdown()
 
 if __name__ == '__main__':
     Runtime(*sys.argv[1:])
@@ -1,15 +1,70 @@
+import json
 import re
+from cStringIO import StringIO
+from datetime import date, datetime, time
+from decimal import Decimal
 
-from sqlalchemy import Column, create_engine, event
+from sqlalchemy import (Column, and_, bindparam, create_engine, event, func, select, text,
+    tuple_)
 from sqlalchemy.dialects.postgresql.base import ARRAY
 from sqlalchemy.engine.url import make_url
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
 
 from spire.schema.fields import BigIntegerType
+from spire.schema.pool import (QUEUE_POOL_PARAMS, InstrumentedQueuePool,
+    enable_fork_protection, enable_pre_ping)
+
+COPY_SCALAR_TYPES = (basestring, bool, int, long, float, Decimal, date, datetime, time)
+
+class Explain(Executable, ClauseElement):
+    """The plan of ``statement``, which is executed as a statement itself so that
+    its parameters are processed exactly as they would be for ``statement``."""
+
+    def __init__(self, statement):
+        self.statement = statement
+
+@compiles(Explain, 'postgresql')
+def compile_postgresql_explain(element, compiler, **params):
+    return 'explain (format json) %s' % compiler.process(element.statement, **params)
 
 class Dialect(object):
-    def __init__(self, dialect, hstore=False):
+    membership_chunk_size = 500
+    supports_queue_pool = True
+
+    def __init__(self, dialect, hstore=False, trigram=False):
         self.dialect = dialect
         self.hstore = hstore
+        self.trigram = trigram
+
+    def bulk_insert(self, connection, table, columns, rows, copy=False):
+        connection.execute(table.insert(), rows)
+
+    def bulk_upsert(self, connection, table, columns, rows, conflict, update):
+        keys = [table.c[key] for key in conflict]
+        if len(keys) == 1:
+            criterion = keys[0].in_([row[conflict[0]] for row in rows])
+        else:
+            criterion = tuple_(*keys).in_([tuple(row[key] for key in conflict) for row in rows])
+
+        existing = set(tuple(row) for row in connection.execute(select(keys).where(criterion)))
+        insertions, updates = [], []
+
+        for row in rows:
+            if tuple(row[key] for key in conflict) in existing:
+                updates.append(row)
+            else:
+                insertions.append(row)
+
+        # the parameters of each update are limited to the updated and conflict columns,
+        # since any other column named in them would also be set
+        if updates and update:
+            statement = table.update().where(and_(*[table.c[key] == bindparam('_%s' % key)
+                for key in conflict])).values(dict((key, bindparam(key)) for key in update))
+            connection.execute(statement, [dict([(key, row[key]) for key in update] +
+                [('_%s' % key, row[key]) for key in conflict]) for row in updates])
+        if insertions:
+            connection.execute(table.insert(), insertions)
 
     def construct_alter_table(self, table, additions=None, removals=None):
         raise NotImplementedError()
@@ -17,11 +72,18 @@ class Dialect(object):
     def construct_lock_table(self, tablename, mode):
         raise NotImplementedError()
 
+    def construct_membership(self, column, values):
+        return column.in_(values)
+
     def create_database(self, url, name, conditional=True, **params):
         pass
 
-    def create_engine(self, url, schema, echo=False):
-        return create_engine(url, echo=echo)
+    def create_engine(self, url, schema, echo=False, pre_ping=False, **params):
+        engine = create_engine(url, echo=echo, **self._construct_pool_params(params))
+        enable_fork_protection(engine)
+        if pre_ping:
+            enable_pre_ping(engine)
+        return engine
 
     def create_role(self, url, name, **params):
         pass
@@ -41,10 +103,89 @@ class Dialect(object):
     def is_database_present(self, url, name):
         return False
 
+    def estimate_count(self, session, query):
+        """Returns the number of rows the query planner estimates ``query`` will
+        return, or ``None`` if this dialect cannot estimate it."""
+
+        return None
+
+    def stream_query(self, query, batch_size):
+        return query.yield_per(batch_size)
+
     def type_is_equivalent(self, left, right):
         return left._type_affinity is right._type_affinity
 
+    def _construct_pool_params(self, params):
+        params = dict((key, value) for key, value in params.iteritems() if value is not None)
+        if self.supports_queue_pool:
+            params['poolclass'] = InstrumentedQueuePool
+        else:
+            for key in QUEUE_POOL_PARAMS:
+                params.pop(key, None)
+        return params
+
 class PostgresqlDialect(Dialect):
+    membership_chunk_size = None
+
+    def bulk_insert(self, connection, table, columns, rows, copy=False):
+        if not copy:
+            return super(PostgresqlDialect, self).bulk_insert(connection, table, columns, rows)
+
+        dialect = connection.dialect
+        processors = [column.type.bind_processor(dialect) for column in columns]
+        keys = [column.key for column in columns]
+
+        # non-null values are always quoted, so that an unquoted \N is unambiguously null;
+        # values which psycopg2 would adapt, such as arrays and hstore dicts, have no
+        # faithful text form here, so rows including them are inserted with executemany
+        buffer = StringIO()
+        for row in rows:
+            fields = []
+            for key, processor in zip(keys, processors):
+                value = row[key]
+                if processor is not None:
+                    value = processor(value)
+                if value is None:
+                    fields.append('\\N')
+                    continue
+                if not isinstance(value, COPY_SCALAR_TYPES):
+                    return super(PostgresqlDialect, self).bulk_insert(connection, table,
+                        columns, rows)
+                if isinstance(value, unicode):
+                    value = value.encode('utf8')
+                elif not isinstance(value, str):
+                    value = str(value)
+                fields.append('"%s"' % value.replace('"', '""'))
+            buffer.write(','.join(fields) + '\n')
+
+        buffer.seek(0)
+        sql = "copy %s (%s) from stdin with csv null '\\N'" % (self._construct_table_name(table),
+            ', '.join(validate_sql_identifier(column.name) for column in columns))
+
+        cursor = connection.connection.cursor()
+        try:
+            cursor.copy_expert(sql, buffer)
+        finally:
+            cursor.close()
+
+    def bulk_upsert(self, connection, table, columns, rows, conflict, update):
+        names = dict((column.key, validate_sql_identifier(column.name)) for column in columns)
+        sql = ['insert into %s (%s) values (%s) on conflict (%s)' % (
+            self._construct_table_name(table),
+            ', '.join(names[column.key] for column in columns),
+            ', '.join(':%s' % column.key for column in columns),
+            ', '.join(names[key] for key in conflict))]
+
+        if update:
+            sql.append('do update set %s' % ', '.join('%s = excluded.%s' % (names[key], names[key])
+                for key in update))
+        else:
+            sql.append('do nothing')
+
+        statement = text(' '.join(sql)).bindparams(*[bindparam(column.key, type_=column.type)
+            for column in columns])
+        connection.execute(statement, rows)
+
     def construct_alter_table(self, table, additions=None, removals=None):
         actions = []
         if removals:
@@ -62,6 +203,10 @@ class PostgresqlDialect(Dialect):
     def construct_lock_table(self, tablename, mode):
         return 'lock table %s in %s mode' % (tablename, mode)
 
+    def construct_membership(self, column, values):
+        # a single array parameter keeps the statement identical for any number of values
+        return column == func.any(bindparam('values', values, type_=ARRAY(column.type)))
+
     def create_database(self, url, name, conditional=True, owner=None):
         if conditional and self.is_database_present(url, name):
             return
@@ -71,16 +216,19 @@ class PostgresqlDialect(Dialect):
             sql += ' owner %s' % validate_sql_identifier(owner)
 
         self._execute_statement(url, sql)
+        url = '%s/%s' % (url.rsplit('/', 1)[0], name)
         if self.hstore:
-            url = '%s/%s' % (url.rsplit('/', 1)[0], name)
             self._execute_statement(url, 'create extension hstore')
+        if self.trigram:
+            self._execute_statement(url, 'create extension pg_trgm')
 
-    def create_engine(self, url, schema, echo=False):
-        engine = create_engine(url, echo=echo)
+    def create_engine(self, url, schema, echo=False, pre_ping=False, **params):
+        engine = super(PostgresqlDialect, self).create_engine(url, schema, echo, pre_ping,
+            **params)
         if self.hstore:
             self._register_hstore_converter(engine)
         return engine
-        
+
     def create_role(self, url, name, login=True, superuser=False):
         sql = ['create role %s' % validate_sql_identifier(name)]
         if login:
@@ -124,6 +272,15 @@ class PostgresqlDialect(Dialect):
 
         self._execute_statement(url, sql)
 
+    def estimate_count(self, session, query):
+        statement = query.statement
+        connection = session.connection(clause=statement)
+
+        plan = connection.execute(Explain(statement)).scalar()
+        if isinstance(plan, basestring):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
     def is_database_present(self, url, name):
         name = validate_sql_identifier(name)
         sql = "select count(*) from pg_database where datname = '%s'" % name
@@ -131,6 +288,11 @@ class PostgresqlDialect(Dialect):
         row = self._execute_statement(url, sql, True)
         return row[0] == 1
 
+    def stream_query(self, query, batch_size):
+        # a named cursor keeps the result set on the server, so only one batch of rows
+        # is held by the client at a time
+        return query.yield_per(batch_size).execution_options(stream_results=True)
+
     def type_is_equivalent(self, left, right):
         if left._type_affinity is not right._type_affinity:
             return False
@@ -150,6 +312,12 @@ class PostgresqlDialect(Dialect):
         
         return ' '.join(sql)
 
+    def _construct_table_name(self, table):
+        name = validate_sql_identifier(table.name)
+        if table.schema:
+            name = '%s.%s' % (validate_sql_identifier(table.schema), name)
+        return name
+
     def _execute_statement(self, url, sql, result=False):
         if isinstance(sql, list):
             sql = ' '.join(sql)
@@ -182,8 +350,11 @@ class PostgresqlDialect(Dialect):
             pass
 
 class SqliteDialect(Dialect):
-    def create_engine(self, url, schema, echo=False):
-        engine = create_engine(url, echo=echo)
+    supports_queue_pool = False
+
+    def create_engine(self, url, schema, echo=False, pre_ping=False, **params):
+        engine = super(SqliteDialect, self).create_engine(url, schema, echo, pre_ping,
+            **params)
 
         @event.listens_for(engine, 'connect')
         def handle_checkout(connection, record):
@@ -1,9 +1,12 @@
 import json
 import re
 
-from sqlalchemy import Column, ForeignKey as _ForeignKey, types
-from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy import DDL, Column, ForeignKey as _ForeignKey, Index, event, types
+from sqlalchemy.dialects.postgresql import ARRAY, TSVECTOR
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.ext.mutable import Mutable
+from sqlalchemy.sql import and_, func, literal, literal_column, or_
+from sqlalchemy.sql.expression import ColumnElement
 from sqlalchemy.types import TypeDecorator, UserDefinedType
 
 from spire.util import uniqid
@@ -12,9 +15,12 @@ __all__ = ('Array', 'ArrayType', 'BigInteger', 'BigIntegerType', 'Boolean',
     'BooleanType', 'Date', 'DateType', 'DateTime', 'DateTimeType', 'Decimal',
     'DecimalType', 'Email', 'EmailType', 'Enumeration', 'EnumerationType',
     'Float', 'FloatType', 'ForeignKey', 'Hstore', 'HstoreType', 'Identifier',
-    'Integer', 'IntegerType', 'Json', 'JsonType', 'Serialized',
-    'SerializedType', 'Text', 'TextType', 'Time', 'TimeType', 'Token',
-    'TokenType', 'UUID', 'UUIDType')
+    'Integer', 'IntegerType', 'Json', 'JsonType', 'SearchIndex', 'SearchMatch',
+    'Serialized', 'SerializedType', 'SimilarMatch', 'Text', 'TextSearch',
+    'TextSearchType', 'TextType', 'Time', 'TimeType', 'Token', 'TokenType',
+    'TrigramIndex', 'UUID', 'UUIDType')
+
+WILDCARD_EXPR = re.compile(r'([%_])')
 
 class TypeDecorator(TypeDecorator):
     def __repr__(self):
@@ -144,6 +150,26 @@ class SerializedType(TypeDecorator):
         if value is not None:
             return json.loads(value)
 
+class TextSearchType(TypeDecorator):
+    """A full-text search document, maintained from the text columns named by
+    ``sources``. On postgresql, this is a ``tsvector`` kept current by a trigger;
+    other databases store nothing, and searches fall back to the source columns."""
+
+    impl = types.Text
+
+    def __init__(self, sources, config='english'):
+        super(TextSearchType, self).__init__()
+        if isinstance(sources, basestring):
+            sources = sources.split(' ')
+
+        self.config = config
+        self.sources = tuple(sources)
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == 'postgresql':
+            return dialect.type_descriptor(TSVECTOR())
+        return dialect.type_descriptor(self.impl)
+
 class TextType(TypeDecorator):
     impl = types.Text
     pattern = None
@@ -167,6 +193,70 @@ class TextType(TypeDecorator):
         if max_length is not None and len(value) > max_length:
             raise ValueError('value is too long')
 
+class SearchMatch(ColumnElement):
+    """Matches rows whose ``column`` contains every word of ``value``, using full-text
+    search on postgresql. ``column`` is either a ``TextSearch`` column or a text
+    column, which is converted to a document when searched."""
+
+    type = types.Boolean()
+
+    def __init__(self, column, value, config=None):
+        self.column = getattr(column, '__clause_element__', lambda: column)()
+        self.value = value
+
+        if config is None:
+            config = getattr(self.column.type, 'config', 'english')
+        self.config = config
+
+    def get_sources(self):
+        column = self.column
+        sources = getattr(column.type, 'sources', None)
+        if sources:
+            return [column.table.c[name] for name in sources]
+        return [column]
+
+class SimilarMatch(ColumnElement):
+    """Matches rows whose ``column`` is similar to ``value``, using the trigram
+    similarity operator of pg_trgm on postgresql."""
+
+    type = types.Boolean()
+
+    def __init__(self, column, value):
+        self.column = getattr(column, '__clause_element__', lambda: column)()
+        self.value = value
+
+@compiles(SearchMatch)
+def compile_search_match(element, compiler, **params):
+    # a fallback for databases without full-text search, which requires each word to
+    # appear within any of the source columns
+    sources = element.get_sources()
+
+    terms = []
+    for word in element.value.split():
+        word = '%' + WILDCARD_EXPR.sub(r'\\\1', word.lower()) + '%'
+        terms.append(or_(*[func.lower(source).like(word, escape='\\') for source in sources]))
+    return compiler.process(and_(*terms), **params)
+
+@compiles(SearchMatch, 'postgresql')
+def compile_postgresql_search_match(element, compiler, **params):
+    config = literal_column("'%s'" % element.config.replace("'", "''"))
+    column = element.column
+    if not isinstance(column.type, TextSearchType):
+        column = func.to_tsvector(config, column)
+
+    return '%s @@ %s' % (compiler.process(column, **params),
+        compiler.process(func.plainto_tsquery(config, literal(element.value)), **params))
+
+@compiles(SimilarMatch)
+def compile_similar_match(element, compiler, **params):
+    value = '%' + WILDCARD_EXPR.sub(r'\\\1', element.value.lower()) + '%'
+    return compiler.process(func.lower(element.column).like(value, escape='\\'), **params)
+
+@compiles(SimilarMatch, 'postgresql')
+def compile_postgresql_similar_match(element, compiler, **params):
+    return '%s %%%% %s' % (compiler.process(element.column, **params),
+        compiler.process(literal(element.value), **params))
+
 class TimeType(TypeDecorator, ValidatesMinMax):
     impl = types.Time
 
@@ -254,17 +344,45 @@ def Integer(minimum=None, maximum=None, sequence=None, **params):
 def Json(**params):
     return Column(JsonType(), **params)
 
+def SearchIndex(name, column, **params):
+    """Declares a GIN index on the ``TextSearch`` column named ``column``."""
+
+    return Index(name, column, postgresql_using='gin', **params)
+
 def Serialized(**params):
     return Column(SerializedType(), **params)
 
 def Text(pattern=None, min_length=None, max_length=None, **params):
     return Column(TextType(pattern, min_length, max_length), **params)
 
+def TextSearch(sources, config='english', **params):
+    column = Column(TextSearchType(sources, config), **params)
+    event.listen(column, 'after_parent_attach', attach_search_trigger)
+    return column
+
+def attach_search_trigger(column, table):
+    config = column.type.config
+    if '.' not in config:
+        config = 'pg_catalog.' + config
+
+    trigger = DDL('create trigger %%(table)s_%s_search before insert or update on'
+        ' %%(fullname)s for each row execute procedure tsvector_update_trigger(%s, \'%s\', %s)'
+        % (column.name, column.name, config, ', '.join(column.type.sources)))
+    event.listen(table, 'after_create', trigger.execute_if(dialect='postgresql'))
+
 def Time(minimum=None, maximum=None, **params):
     return Column(TimeType(minimum, maximum), **params)
 
 def Token(segments=None, **params):
     return Column(TokenType(segments), **params)
 
+def TrigramIndex(name, *columns, **params):
+    """Declares a GIN index of trigrams on the text columns named by ``columns``, which
+    requires pg_trgm and supports the ``similar`` operator along with ``like`` and
+    ``ilike`` patterns containing leading wildcards."""
+
+    ops = dict((column, 'gin_trgm_ops') for column in columns)
+    return Index(name, *columns, postgresql_using='gin', postgresql_ops=ops, **params)
+
 def UUID(**params):
     return Column(UUIDType(), **params)
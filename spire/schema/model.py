@@ -8,6 +8,7 @@ from sqlalchemy.orm.mapper import Mapper
 from sqlalchemy.orm.properties import ColumnProperty
 from sqlalchemy.orm.session import object_session
 
+from spire.schema.dialect import get_dialect
 from spire.schema.schema import Schema, SessionLocals
 from spire.util import get_constructor_args, pluralize
 
@@ -38,6 +39,87 @@ class AttributeValidator(object):
                     event.listen(column_property.class_attribute, 'set',
                         AttributeValidator(column), retval=True)
 
+class BulkRows(object):
+    """Validates and normalizes rows for a bulk operation against a table, in a
+    single pass over the rows which applies the same validation and defaults as
+    are applied to model instances."""
+
+    def __init__(self, table, rows):
+        self.table = table
+
+        present = set()
+        for row in rows:
+            present.update(row)
+
+        self.columns = []
+        for column in table.columns:
+            if column.key in present or self._requires_value(column):
+                self.columns.append(column)
+
+        self.rows = self._prepare_rows(rows)
+        self.supplied = [frozenset(row) for row in rows]
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    @property
+    def keys(self):
+        return [column.key for column in self.columns]
+
+    def chunk(self, size, rows=None):
+        if rows is None:
+            rows = self.rows
+        for i in range(0, len(rows), size):
+            yield rows[i:i + size]
+
+    def partition(self, keys):
+        """Partitions the rows by which of ``keys`` were supplied for each row, so
+        that a column is never updated with a default which was only filled in."""
+
+        partitions = {}
+        for row, supplied in zip(self.rows, self.supplied):
+            partition = tuple(key for key in keys if key in supplied)
+            partitions.setdefault(partition, []).append(row)
+        return sorted(partitions.iteritems())
+
+    def _requires_value(self, column):
+        default = column.default
+        if default and (default.is_scalar or default.is_callable):
+            return True
+        return (not column.nullable and column.server_default is None
+            and column is not self.table._autoincrement_column)
+
+    def _prepare_rows(self, rows):
+        plan = []
+        for column in self.columns:
+            default = column.default
+            if default and default.is_scalar:
+                default = (lambda value: lambda: value)(default.arg)
+            elif default and default.is_callable:
+                default = (lambda function: lambda: function(None))(default.arg)
+            else:
+                default = None
+            plan.append((column.key, column, default, getattr(column.type, 'validate', None)))
+
+        prepared = []
+        for row in rows:
+            values = {}
+            for key, column, default, validate in plan:
+                value = row.get(key)
+                if value is None and default:
+                    value = default()
+                if value is None:
+                    if not column.nullable:
+                        raise ValueError(repr(column))
+                elif validate:
+                    value = validate(None, column, value) or value
+                values[key] = value
+            prepared.append(values)
+        return prepared
+
 class ModelMeta(DeclarativeMeta):
     def __new__(metatype, name, bases, namespace):
         meta = namespace.pop('meta', None)
@@ -149,6 +231,61 @@ class ModelBase(object):
         
         return extraction
 
+    @classmethod
+    def bulk_insert(cls, session, rows, chunk_size=1000, copy=False):
+        """Inserts ``rows``, a sequence of dicts, directly into the table of this model
+        using executemany, bypassing the unit of work. When ``copy`` is true, rows are
+        instead loaded with ``COPY`` where the dialect supports it. Returns the number of
+        rows inserted."""
+
+        rows = BulkRows(cls.__table__, rows)
+        if not rows:
+            return 0
+
+        connection = session.connection(mapper=cls.__mapper__)
+        dialect = get_dialect(connection.engine.url)
+
+        for chunk in rows.chunk(chunk_size):
+            dialect.bulk_insert(connection, cls.__table__, rows.columns, chunk, copy)
+        return len(rows)
+
+    @classmethod
+    def bulk_upsert(cls, session, rows, conflict=None, update=None, chunk_size=1000):
+        """Inserts ``rows``, a sequence of dicts, into the table of this model, updating
+        the columns in ``update`` of those rows which conflict with an existing row on the
+        columns in ``conflict``. ``conflict`` defaults to the primary key, and ``update``
+        to every other column present. Defaults are only applied to inserted rows; a
+        column is only updated for those rows which supply a value for it. Returns the
+        number of rows processed."""
+
+        table = cls.__table__
+        rows = BulkRows(table, rows)
+        if not rows:
+            return 0
+
+        if isinstance(conflict, basestring):
+            conflict = conflict.split(' ')
+        elif not conflict:
+            conflict = [column.key for column in table.primary_key.columns]
+
+        if isinstance(update, basestring):
+            update = update.split(' ')
+        elif update is None:
+            update = [key for key in rows.keys if key not in conflict]
+
+        for key in conflict:
+            for supplied in rows.supplied:
+                if key not in supplied:
+                    raise ValueError('conflict column %r is not present in every row' % key)
+
+        connection = session.connection(mapper=cls.__mapper__)
+        dialect = get_dialect(connection.engine.url)
+
+        for keys, partition in rows.partition(update):
+            for chunk in rows.chunk(chunk_size, partition):
+                dialect.bulk_upsert(connection, table, rows.columns, chunk, conflict, keys)
+        return len(rows)
+
     @classmethod
     def get_polymorphic_implementation(cls, data):
         column = cls.__mapper__.polymorphic_on
@@ -0,0 +1,81 @@
+import os
+from threading import Lock
+from time import time
+
+from sqlalchemy import event
+from sqlalchemy.exc import DisconnectionError
+from sqlalchemy.pool import QueuePool
+
+QUEUE_POOL_PARAMS = ('max_overflow', 'pool_size', 'pool_timeout')
+
+class InstrumentedQueuePool(QueuePool):
+    """A queue pool which records how long checkouts wait for a connection."""
+
+    def __init__(self, creator, **params):
+        super(InstrumentedQueuePool, self).__init__(creator, **params)
+        self.checkouts = 0
+        self.guard = Lock()
+        self.maximum_wait = 0.0
+        self.waited = 0.0
+
+    def describe(self):
+        return {
+            'checked_out': self.checkedout(),
+            'checkouts': self.checkouts,
+            'maximum_wait': self.maximum_wait,
+            'overflow': self.overflow(),
+            'size': self.size(),
+            'wait_time': self.waited,
+        }
+
+    def _do_get(self):
+        started = time()
+        try:
+            return super(InstrumentedQueuePool, self)._do_get()
+        finally:
+            elapsed = time() - started
+            with self.guard:
+                self.checkouts += 1
+                self.waited += elapsed
+                if elapsed > self.maximum_wait:
+                    self.maximum_wait = elapsed
+
+def enable_fork_protection(engine):
+    """Tags each pooled connection with the pid of the process which opened it,
+    and discards, without closing, any connection checked out by another process."""
+
+    @event.listens_for(engine, 'connect')
+    def tag_connection(connection, record):
+        record.info['pid'] = os.getpid()
+
+    @event.listens_for(engine, 'checkout')
+    def verify_connection(connection, record, proxy):
+        pid = os.getpid()
+        if record.info.get('pid', pid) != pid:
+            record.connection = proxy.connection = None
+            raise DisconnectionError('connection opened by process %s cannot be used'
+                ' by process %s' % (record.info['pid'], pid))
+
+def enable_pre_ping(engine):
+    """Tests each connection as it is checked out of the pool, so that stale
+    connections are transparently replaced instead of failing the caller."""
+
+    @event.listens_for(engine, 'checkout')
+    def ping_connection(connection, record, proxy):
+        try:
+            cursor = connection.cursor()
+            try:
+                cursor.execute('select 1')
+            finally:
+                cursor.close()
+        except Exception:
+            raise DisconnectionError()
+
+def warm_engine(engine, connections):
+    acquired = []
+    try:
+        for i in range(connections):
+            acquired.append(engine.connect())
+    finally:
+        for connection in acquired:
+            connection.close()
@@ -1,18 +1,24 @@
+from collections import OrderedDict
+from itertools import cycle
 from threading import Lock
+from time import time
 
 from mesh.standard import OperationError, ValidationError
 
-from scheme import Boolean, Text
+from scheme import Boolean, Enumeration, Integer, Sequence, Text
 from scheme.supplemental import ObjectReference
 from sqlalchemy import MetaData, Table, create_engine, event
 from sqlalchemy.engine.reflection import Inspector
 from sqlalchemy.exc import NoSuchTableError
 from sqlalchemy.orm.session import Session, sessionmaker
+from sqlalchemy.sql.expression import Select
 
 from spire.core import *
 from spire.local import ContextLocals
+from spire.runtime.runtime import register_postfork
 from spire.schema.dialect import get_dialect
 from spire.schema.migration import MigrationInterface
+from spire.schema.pool import InstrumentedQueuePool, warm_engine
 from spire.util import get_package_path
 
 __all__ = ('OperationError', 'Schema', 'SchemaDependency', 'SchemaInterface', 'ValidationError')
@@ -61,6 +67,68 @@ class EnhancedSession(Session):
         except (AttributeError, IndexError):
             pass
 
+class ReplicaRouter(object):
+    """Selects a read replica for a routing session."""
+
+    def __init__(self, engines, strategy='round-robin'):
+        self.candidates = cycle(engines)
+        self.engines = engines
+        self.strategy = strategy
+
+    def dispose(self):
+        for engine in self.engines:
+            engine.dispose()
+
+    def select(self):
+        if self.strategy == 'least-connections':
+            return min(self.engines, key=self._count_connections)
+        else:
+            return next(self.candidates)
+
+    def _count_connections(self, engine):
+        try:
+            return engine.pool.checkedout()
+        except AttributeError:
+            return 0
+
+class RoutingSession(EnhancedSession):
+    """A session which directs reads to a replica and everything else to the
+    primary. Once the session has written anything, all subsequent reads are
+    also directed to the primary, so that they observe those writes."""
+
+    def __init__(self, router=None, **params):
+        super(RoutingSession, self).__init__(**params)
+        self.replica = None
+        self.router = router
+        self.sticky = False
+
+    def close(self):
+        super(RoutingSession, self).close()
+        self.replica = None
+        self.sticky = False
+
+    def flush(self, objects=None):
+        if not self._is_clean():
+            self.sticky = True
+        super(RoutingSession, self).flush(objects)
+
+    def get_bind(self, mapper=None, clause=None):
+        if not (self.sticky or self._flushing):
+            if isinstance(clause, Select) and not self._is_locking(clause):
+                if self.replica is None:
+                    self.replica = self.router.select()
+                return self.replica
+            elif clause is not None:
+                self.sticky = True
+        return super(RoutingSession, self).get_bind(mapper, clause)
+
+    def _is_locking(self, clause):
+        # sqlalchemy 0.9 describes the lock with a clause, which cannot be tested
+        # for truth, while earlier versions only have the for_update flag
+        if getattr(clause, '_for_update_arg', None) is not None:
+            return True
+        return bool(getattr(clause, 'for_update', False))
+
 class Schema(object):
     """A spire schema."""
 
@@ -97,9 +165,21 @@ class SchemaInterface(Unit):
     configuration = Configuration({
         'admin_url': Text(nonnull=True),
         'echo': Boolean(default=False),
+        'engine_idle_timeout': Integer(minimum=1),
         'hstore': Boolean(default=False),
+        'max_overflow': Integer(minimum=-1),
+        'maximum_engines': Integer(minimum=1),
         'migrations': Text(nonnull=True),
+        'pool_pre_ping': Boolean(default=False),
+        'pool_recycle': Integer(minimum=-1),
+        'pool_size': Integer(minimum=0),
+        'pool_timeout': Integer(minimum=0),
+        'pool_warmup': Integer(minimum=0),
+        'replica_strategy': Enumeration(['least-connections', 'round-robin'], nonnull=True,
+            default='round-robin'),
+        'replicas': Sequence(Text(nonempty=True), nonnull=True),
         'schema': Text(nonempty=True),
+        'trigram': Boolean(default=False),
         'url': Text(nonempty=True),
     })
 
@@ -107,14 +187,25 @@ class SchemaInterface(Unit):
         if isinstance(schema, basestring):
             schema = Schema.schemas[schema]
 
-        params = {'hstore': self.configuration.get('hstore', False)}
+        params = {'hstore': self.configuration.get('hstore', False),
+            'trigram': self.configuration.get('trigram', False)}
         self.dialect = get_dialect(url, **params)
 
-        self.cache = {}
+        self.accessed = {}
+        self.cache = OrderedDict()
+        self.counters = {'evictions': 0, 'hits': 0, 'misses': 0}
         self.guard = Lock()
+        self.inherited = []
+        self.retired = []
         self.schema = schema
         self.url = url
 
+        self.idle_timeout = self.configuration.get('engine_idle_timeout')
+        self.maximum_engines = self.configuration.get('maximum_engines')
+        self.next_sweep = 0
+
+        register_postfork(self._reset_after_fork)
+
     @property
     def session(self):
         return self.get_session()
@@ -203,6 +294,18 @@ class SchemaInterface(Unit):
         engine, sessions = self._acquire_engine(tokens)
         return engine
 
+    def get_cache_statistics(self):
+        self.guard.acquire()
+        try:
+            return dict(self.counters, engines=len(self.cache), retired=len(self.retired))
+        finally:
+            self.guard.release()
+
+    def get_pool_statistics(self, **tokens):
+        engine, sessions = self._acquire_engine(tokens)
+        if isinstance(engine.pool, InstrumentedQueuePool):
+            return engine.pool.describe()
+
     def get_session(self, independent=False, **tokens):
         if independent:
             engine, sessions = self._acquire_engine(tokens)
@@ -234,9 +337,11 @@ class SchemaInterface(Unit):
     def purge(self):
         self.guard.acquire()
         try:
-            for engine, sessions in self.cache.itervalues():
-                engine.dispose()
-            self.cache = {}
+            for engine, sessions in self.cache.values() + self.retired:
+                self._dispose_engine(engine, sessions)
+            self.accessed = {}
+            self.cache = OrderedDict()
+            self.retired = []
         finally:
             self.guard.release()
 
@@ -246,22 +351,33 @@ class SchemaInterface(Unit):
 
     def _acquire_engine(self, tokens=None):
         url = self._construct_url(tokens)
-        try:
-            return self.cache[url]
-        except KeyError:
-            pass
+        created = False
 
         self.guard.acquire()
         try:
-            if url in self.cache:
-                return self.cache[url]
-
-            engine, sessions = self._create_engine(url)
-            self.cache[url] = (engine, sessions)
-            return engine, sessions
+            now = time()
+            entry = self.cache.pop(url, None)
+            if entry is not None:
+                self.counters['hits'] += 1
+            else:
+                self.counters['misses'] += 1
+                self._evict_engines(self.maximum_engines)
+                entry = self._create_engine(url, tokens)
+                created = True
+
+            self.cache[url] = entry
+            self.accessed[url] = now
+            if now >= self.next_sweep:
+                self._sweep_engines(now)
         finally:
             self.guard.release()
 
+        # connections are opened outside of the guard, so that warming up a new engine
+        # does not stall callers acquiring other engines
+        if created:
+            self._warm_engine(*entry)
+        return entry
+
     def _collate_column_changes(self, engine, table):
         inspector = Inspector.from_engine(engine)
 
@@ -287,19 +403,120 @@ class SchemaInterface(Unit):
 
         return additions, removals
 
+    def _construct_engine(self, url):
+        configuration = self.configuration
+        echo = configuration.get('echo')
+        if echo:
+            echo = 'debug'
+
+        params = {}
+        for key in ('max_overflow', 'pool_recycle', 'pool_size', 'pool_timeout'):
+            params[key] = configuration.get(key)
+
+        return self.dialect.create_engine(url, self.schema, echo=echo,
+            pre_ping=configuration.get('pool_pre_ping', False), **params)
+
     def _construct_url(self, tokens=None):
         url = self.url
         if tokens:
             url = url % tokens
         return url
 
-    def _create_engine(self, url):
-        echo = self.configuration.get('echo')
-        if echo:
-            echo = 'debug'
+    def _create_engine(self, url, tokens=None):
+        engine = self._construct_engine(url)
+
+        replicas = self.configuration.get('replicas')
+        if not replicas:
+            return engine, sessionmaker(bind=engine, class_=EnhancedSession)
+
+        engines = []
+        for replica in replicas:
+            if tokens:
+                replica = replica % tokens
+            engines.append(self._construct_engine(replica))
+
+        router = ReplicaRouter(engines, self.configuration.get('replica_strategy'))
+        return engine, sessionmaker(bind=engine, class_=RoutingSession, router=router)
+
+    def _dispose_engine(self, engine, sessions):
+        engine.dispose()
+        router = sessions.kw.get('router')
+        if router:
+            router.dispose()
+
+    def _evict_engine(self, url):
+        entry = self.cache.pop(url)
+        del self.accessed[url]
+        self.counters['evictions'] += 1
+
+        # an engine with connections checked out is still in use by some session, and
+        # is only disposed once they have all been returned
+        if self._is_engine_in_use(*entry):
+            self.retired.append(entry)
+        else:
+            self._dispose_engine(*entry)
+
+    def _evict_engines(self, maximum):
+        # the least recently used engines are at the front of the cache
+        if maximum is not None:
+            while len(self.cache) >= maximum:
+                self._evict_engine(next(iter(self.cache)))
+
+    def _is_engine_in_use(self, engine, sessions):
+        engines = [engine]
+        router = sessions.kw.get('router')
+        if router:
+            engines.extend(router.engines)
+
+        for engine in engines:
+            try:
+                if engine.pool.checkedout() > 0:
+                    return True
+            except AttributeError:
+                pass
+        return False
+
+    def _reset_after_fork(self):
+        # engines created before the fork are retained, but never used, so that their
+        # pooled connections are not closed from within this process
+        self.inherited.extend(self.cache.values() + self.retired)
+        self.accessed = {}
+        self.cache = OrderedDict()
+        self.guard = Lock()
+        self.retired = []
+
+    def _sweep_engines(self, now):
+        timeout = self.idle_timeout
+        if timeout is not None:
+            cutoff = now - timeout
+            for url in list(self.cache):
+                if self.accessed[url] > cutoff:
+                    break
+                self._evict_engine(url)
+
+        retired = self.retired
+        if retired:
+            self.retired = []
+            for entry in retired:
+                if self._is_engine_in_use(*entry):
+                    self.retired.append(entry)
+                else:
+                    self._dispose_engine(*entry)
+
+        self.next_sweep = now + min(timeout or 60, 60)
+
+    def _warm_engine(self, engine, sessions):
+        warmup = self.configuration.get('pool_warmup')
+        if not warmup:
+            return
+
+        engines = [engine]
+        router = sessions.kw.get('router')
+        if router:
+            engines.extend(router.engines)
 
-        engine = self.dialect.create_engine(url, self.schema, echo=echo)
-        return engine, sessionmaker(bind=engine, class_=EnhancedSession)
+        for engine in engines:
+            warm_engine(engine, warmup)
 
     def _get_migration_interface(self):
         migrations = self.configuration.get('migrations')
@@ -0,0 +1,165 @@
+from bisect import bisect_right
+from Queue import Empty, Queue
+from zlib import crc32
+
+from scheme import *
+
+from spire.core import *
+from spire.exceptions import SpireError
+from spire.mesh.units import get_mesh_context
+from spire.schema.schema import Schema, SessionLocals
+from spire.support.threadpool import ThreadPool
+
+__all__ = ('ShardRouter', 'ShardingError')
+
+class ShardingError(SpireError):
+    """Raised when a shard cannot be determined for a shard key."""
+
+class ShardRouter(Unit):
+    """Routes sessions for a schema partitioned across several databases.
+
+    Each shard is named and mapped to the tokens which expand the url of the
+    schema interface to the database holding that shard. The shard for a given
+    shard key is determined by the configured strategy: ``hash`` distributes keys
+    evenly across shards, ``range`` assigns each key to the shard with the greatest
+    lower bound not exceeding it, and ``lookup`` consults an explicit table."""
+
+    configuration = Configuration({
+        'context_key': Text(nonempty=True, nonnull=True, default='tenant'),
+        'default_shard': Text(nonempty=True),
+        'lookup': Map(Text(nonempty=True), nonnull=True),
+        'ranges': Sequence(Tuple((Union((Integer(), Text())), Text(nonempty=True))),
+            nonnull=True),
+        'schema': Text(nonempty=True, required=True),
+        'shards': Map(Map(Text(nonempty=True), nonnull=True), nonnull=True, required=True),
+        'strategy': Enumeration(['hash', 'lookup', 'range'], nonnull=True, default='hash'),
+    })
+
+    context_key = configured_property('context_key')
+    strategy = configured_property('strategy')
+    threadpool = Dependency(ThreadPool)
+
+    def __init__(self, schema, shards):
+        self.names = sorted(shards)
+        self.schema = schema
+        self.shards = shards
+
+        self.lookup = dict(self.configuration.get('lookup') or {})
+        ranges = sorted(self.configuration.get('ranges') or [])
+        self.bounds = [bound for bound, shard in ranges]
+        self.ranges = [shard for bound, shard in ranges]
+
+        for name in self.names:
+            SessionLocals.declare((schema, name))
+
+    @property
+    def interface(self):
+        return Schema.interface(self.schema)
+
+    def assign(self, key, shard):
+        """Assigns ``key`` to ``shard`` within the lookup table."""
+
+        if shard not in self.shards:
+            raise ShardingError('unknown shard %r' % shard)
+        self.lookup[key] = shard
+
+    def get_engine(self, key=None, shard=None):
+        return self.interface.get_engine(**self.get_tokens(key, shard))
+
+    def get_session(self, key=None, shard=None, independent=False):
+        """Returns a session for the shard holding ``key``, or for ``shard`` if
+        specified. When neither is specified, the shard key is taken from the
+        mesh context of the current request."""
+
+        if shard is None:
+            shard = self.get_shard(key)
+
+        tokens = self.get_tokens(shard=shard)
+        if independent:
+            return self.interface.get_session(True, **tokens)
+
+        token = (self.schema, shard)
+        session = SessionLocals.get(token)
+        if session:
+            return session
+
+        session = self.interface.get_session(True, **tokens)
+        return SessionLocals.push(token, session, session.close)
+
+    def get_shard(self, key=None):
+        if key is None:
+            key = self._get_context_key()
+
+        strategy = self.strategy
+        if strategy == 'hash':
+            names = self.names
+            return names[(crc32(str(key)) & 0xffffffff) % len(names)]
+
+        shard = None
+        if strategy == 'lookup':
+            shard = self.lookup.get(key)
+        elif strategy == 'range':
+            index = bisect_right(self.bounds, key)
+            if index:
+                shard = self.ranges[index - 1]
+
+        if shard is None:
+            shard = self.configuration.get('default_shard')
+            if shard is None:
+                raise ShardingError('no shard for key %r' % key)
+        return shard
+
+    def get_tokens(self, key=None, shard=None):
+        if shard is None:
+            shard = self.get_shard(key)
+        try:
+            return self.shards[shard]
+        except KeyError:
+            raise ShardingError('unknown shard %r' % shard)
+
+    def scatter(self, function, shards=None, timeout=None):
+        """Calls ``function(session, shard)`` for each shard, or only those in ``shards``,
+        in parallel within the thread pool, returning a dict mapping each shard to the
+        value returned for it. Each call receives an independent session, which is
+        closed once the call returns. The first exception raised by any call is
+        raised once all calls have completed."""
+
+        shards = shards or self.names
+        interface, results = self.interface, Queue()
+
+        def package(shard):
+            session = None
+            try:
+                session = interface.get_session(True, **self.get_tokens(shard=shard))
+                results.put((shard, function(session, shard), None))
+            except Exception, exception:
+                results.put((shard, None, exception))
+            finally:
+                if session is not None:
+                    session.close()
+
+        for shard in shards:
+            self.threadpool.enqueue(lambda shard=shard: package(shard))
+
+        values, error = {}, None
+        for i in range(len(shards)):
+            try:
+                shard, value, exception = results.get(True, timeout)
+            except Empty:
+                raise ShardingError('scatter across %r timed out' % (shards,))
+            if exception is not None:
+                error = error or exception
+            else:
+                values[shard] = value
+
+        if error is not None:
+            raise error
+        return values
+
+    def _get_context_key(self):
+        context = get_mesh_context()
+        if context:
+            key = context.get(self.context_key)
+            if key is not None:
+                return key
+        raise ShardingError('no shard key %r in the current context' % self.context_key)
@@ -0,0 +1,252 @@
+import socket
+from collections import OrderedDict
+from cPickle import HIGHEST_PROTOCOL, dumps, loads
+from hashlib import sha1
+from threading import Lock
+from time import time
+
+from scheme import Integer, Text
+from scheme.supplemental import ObjectReference
+
+from spire.core import Configuration, Unit, configured_property
+from spire.support.logs import LogHelper
+
+log = LogHelper(__name__)
+
+class CacheBackend(object):
+    """A cache backend."""
+
+    def __init__(self, capacity=1024, **params):
+        self.capacity = capacity
+
+    def clear(self):
+        raise NotImplementedError()
+
+    def delete(self, key):
+        raise NotImplementedError()
+
+    def get(self, key):
+        raise NotImplementedError()
+
+    def get_counter(self, key):
+        raise NotImplementedError()
+
+    def increment(self, key):
+        raise NotImplementedError()
+
+    def set(self, key, value, timeout):
+        raise NotImplementedError()
+
+class MemoryBackend(CacheBackend):
+    """An in-process cache backend bounded to ``capacity`` entries, which evicts
+    the least recently used entry when full."""
+
+    def __init__(self, capacity=1024, **params):
+        super(MemoryBackend, self).__init__(capacity)
+        self.counters = {}
+        self.entries = OrderedDict()
+        self.guard = Lock()
+
+    def clear(self):
+        with self.guard:
+            self.entries.clear()
+
+    def delete(self, key):
+        with self.guard:
+            self.entries.pop(key, None)
+
+    def get(self, key):
+        with self.guard:
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                return None
+
+            value, expiration = entry
+            if expiration is not None and expiration <= time():
+                return None
+
+            self.entries[key] = entry
+            return value
+
+    def get_counter(self, key):
+        return self.counters.get(key)
+
+    def increment(self, key):
+        # counters are held apart from entries, so are never evicted
+        with self.guard:
+            value = self.counters[key] = self.counters.get(key, 0) + 1
+            return value
+
+    def set(self, key, value, timeout):
+        expiration = None
+        if timeout:
+            expiration = time() + timeout
+
+        with self.guard:
+            entries = self.entries
+            entries.pop(key, None)
+            while len(entries) >= self.capacity:
+                entries.popitem(False)
+            entries[key] = (value, expiration)
+
+class SocketBackend(CacheBackend):
+    """A cache backend which shares entries between processes through a store
+    speaking the memcached text protocol over a local or tcp socket. Entries are
+    bounded and evicted by the store itself."""
+
+    def __init__(self, address='127.0.0.1:11211', timeout=1, **params):
+        super(SocketBackend, self).__init__(**params)
+        self.address = address
+        self.connection = None
+        self.counters = {}
+        self.guard = Lock()
+        self.timeout = timeout
+
+    def clear(self):
+        self._execute('flush_all\r\n')
+
+    def delete(self, key):
+        self._execute('delete %s\r\n' % self._construct_key(key))
+
+    def get(self, key):
+        response = self._execute('get %s\r\n' % self._construct_key(key), True)
+        if response:
+            return loads(response)
+
+    def get_counter(self, key):
+        response = self._execute('get %s\r\n' % self._construct_key(key), True)
+        if response:
+            return self._observe_counter(key, int(response))
+
+    def increment(self, key):
+        command = 'incr %s 1\r\n' % self._construct_key(key)
+        response = self._execute(command)
+        if response and response[0].isdigit():
+            return self._observe_counter(key, int(response))
+
+        # a counter evicted by the store is reseeded from the clock, but never below a
+        # value it was seen to hold, so that it never returns to a value it previously
+        # held; a counter reseeded first by another process is incremented instead
+        value = max(int(time() * 1000), self.counters.get(key, 0) + 1)
+        response = self._execute('add %s 0 0 %d\r\n%d\r\n' % (self._construct_key(key),
+            len(str(value)), value))
+        if response == 'NOT_STORED':
+            response = self._execute(command)
+            if response and response[0].isdigit():
+                value = int(response)
+        return self._observe_counter(key, value)
+
+    def set(self, key, value, timeout):
+        value = dumps(value, HIGHEST_PROTOCOL)
+        self._execute('set %s 0 %d %d\r\n%s\r\n' % (self._construct_key(key), timeout or 0,
+            len(value), value))
+
+    def _connect(self):
+        address = self.address
+        if address.startswith('/'):
+            connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            host, port = address.rsplit(':', 1)
+            address = (host, int(port))
+            connection = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+
+        connection.settimeout(self.timeout)
+        connection.connect(address)
+        return connection.makefile('rwb')
+
+    def _construct_key(self, key):
+        return sha1(key).hexdigest()
+
+    def _observe_counter(self, key, value):
+        if value > self.counters.get(key, 0):
+            self.counters[key] = value
+        return value
+
+    def _execute(self, command, retrieval=False):
+        with self.guard:
+            try:
+                if not self.connection:
+                    self.connection = self._connect()
+                return self._transact(self.connection, command, retrieval)
+            except (socket.error, EOFError):
+                # the store is only a cache, so its unavailability is treated as a miss
+                log('exception', 'cache store at %r failed', self.address)
+                self.connection = None
+
+    def _transact(self, connection, command, retrieval):
+        connection.write(command)
+        connection.flush()
+
+        line = connection.readline()
+        if not line:
+            raise EOFError()
+        if not retrieval:
+            return line.rstrip('\r\n')
+
+        value = None
+        while line.startswith('VALUE '):
+            length = int(line.split()[3])
+            value = connection.read(length + 2)[:-2]
+            line = connection.readline()
+        return value
+
+class Cache(Unit):
+    """A cache."""
+
+    configuration = Configuration({
+        'address': Text(nonempty=True),
+        'backend': ObjectReference(nonnull=True, default=MemoryBackend),
+        'capacity': Integer(nonnull=True, minimum=1, default=1024),
+        'timeout': Integer(nonnull=True, minimum=0, default=60),
+    })
+
+    timeout = configured_property('timeout')
+
+    def __init__(self, backend, capacity, address=None):
+        params = {'capacity': capacity}
+        if address:
+            params['address'] = address
+
+        self.backend = backend(**params)
+        self.counters = {'hits': 0, 'misses': 0}
+        self.guard = Lock()
+
+    def advance_generation(self, namespace):
+        """Advances the generation of ``namespace``, invalidating every entry
+        cached under an earlier generation."""
+
+        return self.backend.increment('generation:%s' % namespace)
+
+    def clear(self):
+        self.backend.clear()
+
+    def delete(self, key):
+        self.backend.delete(key)
+
+    def get(self, key):
+        value = self.backend.get(key)
+        with self.guard:
+            if value is None:
+                self.counters['misses'] += 1
+            else:
+                self.counters['hits'] += 1
+        return value
+
+    def get_generation(self, namespace):
+        generation = self.backend.get_counter('generation:%s' % namespace)
+        if generation is None:
+            generation = self.advance_generation(namespace)
+        return generation
+
+    def set(self, key, value, timeout=None):
+        if timeout is None:
+            timeout = self.timeout
+        self.backend.set(key, value, timeout)
+
+    def stats(self):
+        with self.guard:
+            stats = dict(self.counters)
+
+        lookups = stats['hits'] + stats['misses']
+        stats['ratio'] = (float(stats['hits']) / lookups if lookups else 0.0)
+        return stats
@@ -0,0 +1,114 @@
+from threading import Event, Lock
+
+class PendingCall(object):
+    """The eventual outcome of a call shared by several callers."""
+
+    def __init__(self):
+        self.completed = Event()
+        self.exception = None
+        self.value = None
+
+    def result(self):
+        self.completed.wait()
+        if self.exception is not None:
+            raise self.exception
+        return self.value
+
+class SingleFlight(object):
+    """Coalesces concurrent calls sharing a key, so that only the first caller makes
+    the call and every caller which arrives before it completes shares its outcome.
+    When ``copy`` is specified, it is applied to the value returned to each caller
+    other than the first, so that callers do not share mutable values."""
+
+    def __init__(self, copy=None):
+        self.calls = {}
+        self.copy = copy
+        self.guard = Lock()
+
+    def call(self, key, function, *args, **params):
+        with self.guard:
+            call = self.calls.get(key)
+            if call is not None:
+                leader = False
+            else:
+                leader, call = True, PendingCall()
+                self.calls[key] = call
+
+        if not leader:
+            value = call.result()
+            if self.copy:
+                value = self.copy(value)
+            return value
+
+        try:
+            call.value = function(*args, **params)
+        except Exception, exception:
+            call.exception = exception
+            raise
+        finally:
+            with self.guard:
+                del self.calls[key]
+            call.completed.set()
+        return call.value
+
+class PendingBatch(PendingCall):
+    def __init__(self):
+        super(PendingBatch, self).__init__()
+        self.closed = Event()
+        self.keys = []
+        self.present = set()
+
+    def add(self, key):
+        if key not in self.present:
+            self.keys.append(key)
+            self.present.add(key)
+
+class BatchLoader(object):
+    """Collects the keys requested within a short window into a single batch, which
+    is loaded with one call. The first caller of each batch waits up to ``window``
+    seconds, or until ``maximum`` distinct keys have been requested, then calls the
+    function it was given with the keys of the batch; that function must return a dict
+    mapping each key to its value. Only callers specifying the same ``context`` share
+    a batch, since the batch is loaded within the context of its first caller. When
+    ``copy`` is specified, it is applied to the value returned to each caller other
+    than the first, so that callers do not share mutable values."""
+
+    def __init__(self, window=0.005, maximum=100, copy=None):
+        self.batches = {}
+        self.copy = copy
+        self.guard = Lock()
+        self.maximum = maximum
+        self.window = window
+
+    def get(self, key, function, context=None):
+        batches = self.batches
+        with self.guard:
+            batch = batches.get(context)
+            leader = batch is None
+            if leader:
+                batch = batches[context] = PendingBatch()
+
+            batch.add(key)
+            if len(batch.keys) >= self.maximum:
+                del batches[context]
+                batch.closed.set()
+
+        if not leader:
+            value = batch.result().get(key)
+            if self.copy:
+                value = self.copy(value)
+            return value
+
+        batch.closed.wait(self.window)
+        with self.guard:
+            if batches.get(context) is batch:
+                del batches[context]
+
+        try:
+            batch.value = function(list(batch.keys))
+        except Exception, exception:
+            batch.exception = exception
+            raise
+        finally:
+            batch.completed.set()
+        return batch.value.get(key)
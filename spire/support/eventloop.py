@@ -0,0 +1,133 @@
+from thread import start_new_thread
+from threading import Event, Lock
+
+try:
+    import asyncio
+except ImportError:
+    try:
+        import trollius as asyncio
+    except ImportError:
+        asyncio = None
+
+if asyncio:
+    ensure_future = getattr(asyncio, 'ensure_future', None) or getattr(asyncio, 'async')
+
+from spire.core import Dependency, Unit
+from spire.runtime.runtime import register_postfork
+from spire.support.logs import LogHelper
+from spire.support.threadpool import ThreadPool
+
+log = LogHelper(__name__)
+
+class CoroutineTimeout(Exception):
+    """Raised when a coroutine does not complete in time."""
+
+class CoroutineResult(object):
+    """The eventual result of a coroutine submitted to an event loop."""
+
+    def __init__(self):
+        self.completed = Event()
+        self.exception = None
+        self.value = None
+
+    def __repr__(self):
+        return 'CoroutineResult(completed=%r)' % self.completed.is_set()
+
+    def complete(self, future):
+        if future.cancelled():
+            self.exception = asyncio.CancelledError()
+        elif future.exception() is not None:
+            self.exception = future.exception()
+        else:
+            self.value = future.result()
+        self.completed.set()
+
+    def result(self, timeout=None):
+        if not self.completed.wait(timeout):
+            raise CoroutineTimeout()
+        if self.exception is not None:
+            raise self.exception
+        return self.value
+
+class EventLoop(Unit):
+    """An event loop running within a dedicated thread."""
+
+    threadpool = Dependency(ThreadPool)
+    supported = bool(asyncio)
+
+    def __init__(self):
+        if not asyncio:
+            raise RuntimeError('neither asyncio nor trollius is available')
+
+        self.guard = Lock()
+        self.loop = None
+        register_postfork(self._reset_after_fork)
+
+    def run_in_pool(self, function, *args, **params):
+        """Runs ``function`` within the thread pool, returning a future which can
+        be awaited by coroutines running within this event loop."""
+
+        loop = self._acquire_loop()
+        future = asyncio.Future(loop=loop)
+
+        def package():
+            try:
+                value = function(*args, **params)
+            except Exception, exception:
+                loop.call_soon_threadsafe(self._resolve_future, future, None, exception)
+            else:
+                loop.call_soon_threadsafe(self._resolve_future, future, value, None)
+
+        self.threadpool.enqueue(package)
+        return future
+
+    def stop(self):
+        with self.guard:
+            loop, self.loop = self.loop, None
+        if loop:
+            loop.call_soon_threadsafe(loop.stop)
+
+    def submit_coroutine(self, coroutine):
+        loop, result = self._acquire_loop(), CoroutineResult()
+        loop.call_soon_threadsafe(self._schedule_coroutine, loop, coroutine, result)
+        return result
+
+    def _acquire_loop(self):
+        loop = self.loop
+        if loop:
+            return loop
+
+        with self.guard:
+            if not self.loop:
+                self.loop = asyncio.new_event_loop()
+                start_new_thread(self._run_loop, (self.loop,))
+            return self.loop
+
+    def _reset_after_fork(self):
+        self.loop = None
+
+    def _resolve_future(self, future, value, exception):
+        if future.cancelled():
+            return
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(value)
+
+    def _run_loop(self, loop):
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_forever()
+        except Exception:
+            log('exception', 'uncaught exception within event loop %r', loop)
+        finally:
+            loop.close()
+
+    def _schedule_coroutine(self, loop, coroutine, result):
+        try:
+            task = ensure_future(coroutine, loop=loop)
+        except Exception, exception:
+            result.exception = exception
+            result.completed.set()
+        else:
+            task.add_done_callback(result.complete)
@@ -1,44 +1,350 @@
+import json
 import logging
-from datetime import datetime
+from Queue import Empty, Full, Queue
+from threading import Lock, Thread
+from time import gmtime, strftime
 
 try:
     from logging.config import dictConfig
 except ImportError:
     dictConfig = None
 
+QUEUE_HANDLERS = []
+QUEUE_HANDLERS_GUARD = Lock()
+
+SCALAR_TYPES = (basestring, bool, int, long, float, type(None))
+
 def configure_logging(configuration):
     if 'version' not in configuration:
         configuration['version'] = 1
     if dictConfig:
+        stop_queue_handlers()
         dictConfig(configuration)
 
+    queue = configuration.get('queue')
+    if queue:
+        install_queue_handlers(**queue)
+    LogHelper.invalidate()
+
+def enumerate_loggers():
+    yield logging.getLogger()
+    for logger in logging.Logger.manager.loggerDict.values():
+        if isinstance(logger, logging.Logger):
+            yield logger
+
+def install_queue_handlers(handlers=None, size=10000, batch=100, policy='drop'):
+    """Replaces each configured handler, or only those named in ``handlers``,
+    with a ``QueueHandler`` which writes to it from a listener thread."""
+
+    wrappers = {}
+    for logger in enumerate_loggers():
+        for i, handler in enumerate(logger.handlers):
+            if isinstance(handler, QueueHandler):
+                continue
+            if handlers is not None and handler.name not in handlers:
+                continue
+
+            wrapper = wrappers.get(handler)
+            if not wrapper:
+                wrapper = wrappers[handler] = QueueHandler(handler, size, batch, policy)
+            logger.handlers[i] = wrapper
+
+def restart_queue_handlers():
+    """Restarts the listener of each queue handler within a forked process, after
+    replacing any lock which another thread of the parent might have held."""
+
+    global QUEUE_HANDLERS_GUARD
+    QUEUE_HANDLERS_GUARD = Lock()
+    for handler in QUEUE_HANDLERS:
+        handler.createLock()
+        handler.target.createLock()
+        handler.start()
+
+def stop_queue_handlers():
+    with QUEUE_HANDLERS_GUARD:
+        handlers = list(QUEUE_HANDLERS)
+    for handler in handlers:
+        handler.close()
+
+class lazy(object):
+    """A log argument which is only evaluated when the record is formatted."""
+
+    def __init__(self, function, *args):
+        self.args = args
+        self.function = function
+
+    def __repr__(self):
+        return repr(self.function(*self.args))
+
+    def __str__(self):
+        value = self.function(*self.args)
+        if isinstance(value, unicode):
+            return value.encode('utf8')
+        return str(value)
+
+    def __unicode__(self):
+        value = self.function(*self.args)
+        if isinstance(value, str):
+            return value.decode('utf8', 'replace')
+        return unicode(value)
+
+class StructuredMessage(object):
+    """A log message with key/value fields."""
+
+    def __init__(self, message, args, fields):
+        self.args = args
+        self.fields = fields
+        self.message = message
+
+    def __str__(self):
+        message = self.message
+        if self.args:
+            message = message % self.args
+
+        fields = self.fields
+        if not fields:
+            return message
+
+        pairs = ' '.join('%s=%s' % (key, fields[key]) for key in sorted(fields))
+        return '%s %s' % (message, pairs)
+
+    def capture(self):
+        """Returns a copy of this message with its arguments formatted and each
+        non-scalar field converted to a string."""
+
+        fields = {}
+        for key, value in self.fields.iteritems():
+            if not isinstance(value, SCALAR_TYPES):
+                value = str(value)
+            fields[key] = value
+        return StructuredMessage(self.format_message(), (), fields)
+
+    def format_message(self):
+        if self.args:
+            return self.message % self.args
+        return self.message
+
+class QueueListener(object):
+    """Writes records taken from a queue to a handler, in batches."""
+
+    def __init__(self, queue, target, batch):
+        self.batch = batch
+        self.queue = queue
+        self.target = target
+        self.thread = Thread(target=self.run, name='QueueListener(%r)' % target)
+        self.thread.daemon = True
+
+    def run(self):
+        queue, batch = self.queue, self.batch
+        while True:
+            records = [queue.get()]
+            try:
+                while len(records) < batch:
+                    records.append(queue.get_nowait())
+            except Empty:
+                pass
+
+            try:
+                index = records.index(None)
+            except ValueError:
+                self.write(records)
+            else:
+                self.write(records[:index])
+                return
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self, timeout=None):
+        self.queue.put(None)
+        self.thread.join(timeout)
+
+    def write(self, records):
+        target = self.target
+        if type(target) in (logging.StreamHandler, logging.FileHandler) and target.stream:
+            lines, formatted = [], []
+            for record in records:
+                if target.filter(record):
+                    try:
+                        lines.append(target.format(record))
+                        formatted.append(record)
+                    except Exception:
+                        target.handleError(record)
+
+            if lines:
+                target.acquire()
+                try:
+                    self._write_lines(target, lines, formatted)
+                except Exception:
+                    target.handleError(formatted[-1])
+                finally:
+                    target.release()
+        else:
+            for record in records:
+                target.handle(record)
+
+    def _write_lines(self, target, lines, records):
+        stream = target.stream
+        if not getattr(stream, 'encoding', None):
+            # unicode lines are encoded as utf-8 for a stream without an encoding, as
+            # StreamHandler.emit eventually does
+            lines = [(line.encode('utf8') if isinstance(line, unicode) else line)
+                for line in lines]
+
+        try:
+            stream.write('\n'.join(lines) + '\n')
+        except UnicodeError:
+            # lines which cannot be written together are instead written as each
+            # record would have been by the target itself
+            for record in records:
+                target.emit(record)
+        else:
+            target.flush()
+
+class QueueHandler(logging.Handler):
+    """A handler which places records on a bounded queue, to be written to the
+    wrapped handler by a listener thread. When the queue is full, records are
+    either dropped and counted or the caller blocks, depending on ``policy``."""
+
+    def __init__(self, target, size=10000, batch=100, policy='drop'):
+        logging.Handler.__init__(self, target.level)
+        if policy not in ('block', 'drop'):
+            raise ValueError(policy)
+
+        self.batch = batch
+        self.dropped = 0
+        self.listener = None
+        self.policy = policy
+        self.size = size
+        self.target = target
+
+        self.start()
+        with QUEUE_HANDLERS_GUARD:
+            QUEUE_HANDLERS.append(self)
+
+    def close(self):
+        with QUEUE_HANDLERS_GUARD:
+            if self in QUEUE_HANDLERS:
+                QUEUE_HANDLERS.remove(self)
+
+        listener, self.listener = self.listener, None
+        if listener:
+            listener.stop()
+            self.target.close()
+        logging.Handler.close(self)
+
+    def emit(self, record):
+        if self.listener is None:
+            return
+
+        try:
+            self.prepare(record)
+        except Exception:
+            self.handleError(record)
+            return
+
+        if self.policy == 'block':
+            self.queue.put(record)
+            return
+
+        try:
+            self.queue.put_nowait(record)
+        except Full:
+            self.dropped += 1
+
+    def prepare(self, record):
+        """Formats the message of ``record`` before it is queued, so that the record
+        reflects its arguments as they were when it was logged."""
+
+        message = record.msg
+        if isinstance(message, StructuredMessage):
+            record.msg = message.capture()
+        else:
+            record.msg = record.getMessage()
+        record.args = None
+
+    def start(self):
+        self.queue = Queue(self.size)
+        self.listener = QueueListener(self.queue, self.target, self.batch)
+        self.listener.start()
+
 class LogFormatter(logging.Formatter):
     def __init__(self, format='%(timestamp)s %(name)s %(levelname)s %(message)s'):
         logging.Formatter.__init__(self, format)
+        self.timestamp = (None, None)
 
     def format(self, record):
-        record.timestamp = datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
+        record.timestamp = self.format_timestamp(record)
         return logging.Formatter.format(self, record)
 
+    def format_timestamp(self, record):
+        second = int(record.created)
+        cached, timestamp = self.timestamp
+        if second != cached:
+            timestamp = strftime('%Y-%m-%dT%H:%M:%SZ', gmtime(second))
+            self.timestamp = (second, timestamp)
+        return timestamp
+
+class JsonFormatter(LogFormatter):
+    """Formats each record as a JSON object. The fields of a structured message
+    are nested under ``fields``, so that they never collide with the keys of
+    the record itself."""
+
+    def format(self, record):
+        entry = {'timestamp': self.format_timestamp(record), 'name': record.name,
+            'level': record.levelname}
+
+        message = record.msg
+        if isinstance(message, StructuredMessage):
+            entry['message'] = message.format_message()
+            entry['fields'] = message.fields
+        else:
+            entry['message'] = record.getMessage()
+
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
 class LogHelper(object):
-    LEVELS = { 
+    LEVELS = {
         'debug': logging.DEBUG,
         'info': logging.INFO,
         'warning': logging.WARNING,
         'error': logging.ERROR,
         'critical': logging.CRITICAL,
-    }   
+    }
+
+    generation = 0
 
     def __init__(self, logger):
         if isinstance(logger, basestring):
             logger = logging.getLogger(logger)
+        self.cache = {}
+        self.cached_generation = self.generation
         self.logger = logger
 
-    def __call__(self, level, message, *args):
+    def __call__(self, level, message, *args, **fields):
+        if level != 'exception' and not self.enabled(level):
+            return
+
+        if fields:
+            message, args = StructuredMessage(message, args, fields), ()
         if level == 'exception':
             self.logger.exception(message, *args)
         else:
             self.logger.log(self.LEVELS[level], message, *args)
 
     def enabled(self, level):
-        return self.logger.isEnabledFor(self.LEVELS[level])
+        if self.cached_generation != LogHelper.generation:
+            self.cache = {}
+            self.cached_generation = LogHelper.generation
+
+        try:
+            return self.cache[level]
+        except KeyError:
+            enabled = self.cache[level] = self.logger.isEnabledFor(self.LEVELS[level])
+            return enabled
+
+    @classmethod
+    def invalidate(cls):
+        cls.generation += 1
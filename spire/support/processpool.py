@@ -0,0 +1,92 @@
+import os
+from cPickle import HIGHEST_PROTOCOL, dumps, loads
+from multiprocessing import Pool
+from multiprocessing.sharedctypes import RawArray
+from threading import Lock
+
+from scheme import Integer, Map
+
+from spire.core import Configuration, Unit
+from spire.runtime.runtime import register_postfork, register_shutdown
+from spire.support.logs import LogHelper
+
+log = LogHelper(__name__)
+
+SHARED_BUFFERS = {}
+
+def execute_package(package):
+    try:
+        package = loads(package)
+        package()
+    except Exception:
+        log('exception', 'package %r raised exception', package)
+
+def get_shared_buffer(name):
+    """Returns the shared buffer ``name``, which is mapped into every worker
+    process of a pool at fork and so never needs to be pickled."""
+
+    return SHARED_BUFFERS[name]
+
+class ProcessPool(Unit):
+    """A process pool."""
+
+    configuration = Configuration({
+        'buffers': Map(Integer(nonnull=True, minimum=1), nonnull=True),
+        'maximum_tasks': Integer(minimum=1),
+        'processes': Integer(minimum=1),
+    })
+
+    def __init__(self):
+        self.buffers = {}
+        self.guard = Lock()
+        self.pid = None
+        self.pool = None
+        register_postfork(self._reset_after_fork)
+        register_shutdown(self.close)
+
+    def close(self):
+        with self.guard:
+            pool, self.pool = self.pool, None
+        if pool and self.pid == os.getpid():
+            pool.close()
+            pool.join()
+
+    def enqueue(self, package):
+        """Enqueues ``package`` for execution within a worker process. Since the
+        outcome of the package is discarded, ``package`` is pickled here so that a
+        package which cannot be sent to a worker is rejected immediately; the pickled
+        package is what is sent, so it is only pickled once."""
+
+        try:
+            package = dumps(package, HIGHEST_PROTOCOL)
+        except Exception, exception:
+            raise ValueError('package %r cannot be pickled: %s' % (package, exception))
+        self._acquire_pool().apply_async(execute_package, (package,))
+
+    def submit(self, function, *args, **params):
+        return self._acquire_pool().apply_async(function, args, params)
+
+    def _acquire_pool(self):
+        pool = self.pool
+        if pool and self.pid == os.getpid():
+            return pool
+
+        with self.guard:
+            if not self.pool or self.pid != os.getpid():
+                self._allocate_buffers()
+                self.pool = Pool(self.configuration.get('processes'),
+                    maxtasksperchild=self.configuration.get('maximum_tasks'))
+                self.pid = os.getpid()
+            return self.pool
+
+    def _allocate_buffers(self):
+        buffers = self.configuration.get('buffers')
+        if not buffers:
+            return
+
+        for name, size in buffers.iteritems():
+            self.buffers[name] = SHARED_BUFFERS[name] = RawArray('c', size)
+
+    def _reset_after_fork(self):
+        self.buffers = {}
+        self.pid = self.pool = None
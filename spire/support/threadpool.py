@@ -1,11 +1,13 @@
+from bisect import bisect_left
 from collections import deque
 from thread import error as ThreadError, get_ident, start_new_thread
 from threading import Lock
 from time import sleep, time
 
-from scheme import Integer
+from scheme import Boolean, Integer, Sequence, Token
 
 from spire.core import Configuration, Unit, configured_property
+from spire.exceptions import ConfigurationError
 from spire.support.logs import LogHelper
 
 log = LogHelper(__name__)
@@ -13,6 +15,68 @@ log = LogHelper(__name__)
 class RetireThread(Exception):
     """Retires a thread."""
 
+class PoolSaturated(Exception):
+    """Raised when a package is rejected by a saturated pool."""
+
+class Histogram(object):
+    """A cumulative histogram of durations, in seconds."""
+
+    BOUNDS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0)
+
+    def __init__(self, bounds=BOUNDS):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def describe(self):
+        buckets, cumulative = [], 0
+        for bound, count in zip(self.bounds + ('+Inf',), self.buckets):
+            cumulative += count
+            buckets.append((bound, cumulative))
+        return {'buckets': buckets, 'count': self.count, 'sum': self.total}
+
+    def observe(self, value):
+        self.buckets[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+
+class InstrumentedPackage(object):
+    """A package which records when it was enqueued, started and finished."""
+
+    def __init__(self, package):
+        self.enqueued = time()
+        self.finished = None
+        self.package = package
+        self.started = None
+
+    def __call__(self):
+        self.started = time()
+        try:
+            self.package()
+        finally:
+            self.finished = time()
+
+    def __repr__(self):
+        return 'InstrumentedPackage(%r)' % self.package
+
+class SerialPackage(object):
+    """A package which holds its key until it completes."""
+
+    def __init__(self, pool, key, package):
+        self.key = key
+        self.package = package
+        self.pool = pool
+
+    def __call__(self):
+        try:
+            self.package()
+        finally:
+            self.pool._release_key(self.key)
+
+    def __repr__(self):
+        return 'SerialPackage(%r, %r)' % (self.key, self.package)
+
 class PooledThread(object):
     """A pooled thread."""
 
@@ -64,6 +128,8 @@ class PooledThread(object):
                             log('exception', 'package %r raised exception', package)
                     self.package = None
                     with pool.guard:
+                        if pool.instrumented and package:
+                            pool._record_package(package)
                         if pool._request_package(self) is False:
                             raise RetireThread()
                 else:
@@ -79,37 +145,102 @@ class ThreadPool(Unit):
     """A thread pool."""
 
     configuration = Configuration({
+        'default_lane': Token(segments=1, nonnull=True),
         'idle_threshold': Integer(nonnull=True, minimum=0, default=4),
         'idle_timeout': Integer(nonnull=True, minimum=0, default=300),
+        'instrumented': Boolean(nonnull=True, default=False),
+        'lanes': Sequence(Token(segments=1, nonempty=True), nonnull=True, min_length=1,
+            unique=True, default=['default']),
+        'maximum_pending': Integer(minimum=0),
         'maximum_threads': Integer(nonnull=True, minimum=1, default=16),
         'minimum_threads': Integer(nonnull=True, minimum=0, default=0),
     })
 
     idle_threshold = configured_property('idle_threshold')
     idle_timeout = configured_property('idle_timeout')
+    lanes = configured_property('lanes')
     maximum_threads = configured_property('maximum_threads')
     minimum_threads = configured_property('minimum_threads')
 
     def __init__(self):
         self.activity = None
+        self.backlog = 0
         self.counter = 0
         self.guard = Lock()
         self.idle = deque()
-        self.pending = deque()
+        self.serials = {}
         self.spare = None
         self.threads = {}
+        self.waiting = 0
+
+        lanes = self.lanes
+        self.default_lane = self.configuration.get('default_lane') or lanes[0]
+        self.pending = [deque() for lane in lanes]
+        self.priorities = dict((lane, i) for i, lane in enumerate(lanes))
+
+        if self.default_lane not in self.priorities:
+            raise ConfigurationError('default lane %r is not a configured lane'
+                % self.default_lane)
+
+        self.instrumented = self.configuration.get('instrumented', False)
+        self.maximum_pending = self.configuration.get('maximum_pending')
+
+        self.counters = {'queued': 0, 'deferred': 0, 'rejected': 0, 'retired': 0}
+        if self.instrumented:
+            self.run_time = Histogram()
+            self.wait_time = Histogram()
+
+    def enqueue(self, package, lane=None, key=None):
+        """Enqueues ``package`` for execution within ``lane``, which defaults to the
+        configured default lane. Packages enqueued with the same ``key`` execute
+        serially, in the order they were enqueued."""
+
+        try:
+            priority = self.priorities[lane or self.default_lane]
+        except KeyError:
+            raise ValueError('unknown lane %r' % lane)
+
+        if key is not None:
+            package = SerialPackage(self, key, package)
+        if self.instrumented:
+            package = InstrumentedPackage(package)
 
-    def enqueue(self, package):
         with self.guard:
-            if self.idle:
-                self.idle.pop().assign(package)
-            elif self.spare:
-                self.spare.assign(package)
-                self.spare = None
-            elif len(self.threads) < self.maximum_threads:
-                self._grow_pool().assign(package)
+            if key is None:
+                self._dispatch_package(package, priority)
+            elif key in self.serials:
+                self._check_backlog(package)
+                self.serials[key].append((package, priority))
+                self.waiting += 1
             else:
-                self.pending.append(package)
+                self.serials[key] = deque()
+                try:
+                    self._dispatch_package(package, priority)
+                except PoolSaturated:
+                    del self.serials[key]
+                    raise
+            self.counters['queued'] += 1
+
+    def stats(self):
+        with self.guard:
+            idle = len(self.idle)
+            threads = len(self.threads)
+            stats = dict(self.counters, idle=idle, pending=self.backlog, threads=threads,
+                running=threads - idle - (1 if self.spare else 0),
+                serialized=len(self.serials), waiting=self.waiting)
+
+            stats['lanes'] = dict((lane, len(self.pending[priority]))
+                for lane, priority in self.priorities.iteritems())
+            if self.instrumented:
+                stats.update(run_time=self.run_time.describe(),
+                    wait_time=self.wait_time.describe())
+            return stats
+
+    def _check_backlog(self, package):
+        maximum = self.maximum_pending
+        if maximum is not None and self.backlog + self.waiting >= maximum:
+            self.counters['rejected'] += 1
+            raise PoolSaturated('package %r rejected by saturated pool' % package)
 
     def _confirm_retirement(self, thread):
         with self.guard:
@@ -120,6 +251,21 @@ class ThreadPool(Unit):
                 self._idle_thread()
                 return True
 
+    def _dispatch_package(self, package, priority, accepted=False):
+        if self.idle:
+            self.idle.pop().assign(package)
+        elif self.spare:
+            self.spare.assign(package)
+            self.spare = None
+        elif len(self.threads) < self.maximum_threads:
+            self._grow_pool().assign(package)
+        else:
+            if not accepted:
+                self._check_backlog(package)
+            self.pending[priority].append(package)
+            self.backlog += 1
+            self.counters['deferred'] += 1
+
     def _grow_pool(self):
         self.counter += 1
         thread = PooledThread(self, self.counter)
@@ -133,11 +279,20 @@ class ThreadPool(Unit):
             self.spare = self.idle.popleft()
             self.spare.assign(False)
 
+    def _record_package(self, package):
+        if package.started is not None:
+            self.wait_time.observe(package.started - package.enqueued)
+        if package.finished is not None:
+            self.run_time.observe(package.finished - package.started)
+
     def _request_package(self, thread):
         activity = self.activity
         if not activity:
-            if self.pending:
-                thread.assign(self.pending.popleft())
+            for lane in self.pending:
+                if lane:
+                    thread.assign(lane.popleft())
+                    self.backlog -= 1
+                    break
             else:
                 self._idle_thread()
                 self.idle.append(thread)
@@ -148,7 +303,18 @@ class ThreadPool(Unit):
             if excess == 1:
                 self.activity = None
 
+    def _release_key(self, key):
+        with self.guard:
+            waiting = self.serials[key]
+            if waiting:
+                package, priority = waiting.popleft()
+                self.waiting -= 1
+                self._dispatch_package(package, priority, True)
+            else:
+                del self.serials[key]
+
     def _retire_thread(self, thread, shutdown=True):
         del self.threads[thread.identifier]
+        self.counters['retired'] += 1
         if shutdown:
             thread.assign(None)
@@ -1,13 +1,17 @@
 from unittest2 import TestCase
 
 import scheme
+from sqlalchemy import event
+from sqlalchemy.orm import Query
 from mesh.standard import *
 from mesh.transport.base import ServerResponse
 
 from spire.core import *
+from spire.exceptions import ConfigurationError
 from spire.local import ContextLocals
-from spire.mesh.controllers import ModelController
+from spire.mesh.controllers import ModelController, ResourceExtractor
 from spire import schema as _schema
+from spire.support.cache import Cache, MemoryBackend
 from spire.util import uniqid
 
 class Example(_schema.Model):
@@ -18,6 +22,30 @@ class Example(_schema.Model):
     name = _schema.Token(nullable=False)
     value = _schema.Integer()
 
+class Author(_schema.Model):
+    class meta:
+        schema = 'example'
+
+    id = _schema.UUID(nullable=False, primary_key=True, default=uniqid)
+    name = _schema.Token(nullable=False)
+
+    @property
+    def titles(self):
+        return sorted(entry.title for entry in self.entries)
+
+class Entry(_schema.Model):
+    class meta:
+        schema = 'example'
+
+    id = _schema.UUID(nullable=False, primary_key=True, default=uniqid)
+    author_id = _schema.ForeignKey('author.id', nullable=False)
+    title = _schema.Token(nullable=False)
+    author = _schema.relationship(Author, backref='entries')
+
+    @property
+    def author_name(self):
+        return self.author.name
+
 class ExampleResource(Resource):
     name = 'example'
     version = 1
@@ -35,7 +63,45 @@ class Controller(ModelController):
     schema = _schema.SchemaDependency('example')
     mapping = {'id': 'id', 'name': 'name', 'value': 'value'}
 
+class EntryResource(Resource):
+    name = 'entry'
+    version = 1
+
+    class schema:
+        id = scheme.UUID(nonempty=True)
+        title = scheme.Token(nonempty=True)
+        author_name = scheme.Token()
+
+class EntryController(ModelController):
+    resource = EntryResource
+    version = (1, 0)
+
+    model = Entry
+    schema = _schema.SchemaDependency('example')
+    mapping = {'id': 'id', 'title': 'title', 'author_name': 'author_name'}
+    eager_loading = {'author_name': ('author', 'joined')}
+
+class AuthorResource(Resource):
+    name = 'author'
+    version = 1
+
+    class schema:
+        id = scheme.UUID(nonempty=True)
+        name = scheme.Token(nonempty=True)
+        titles = scheme.Sequence(scheme.Token())
+
+class AuthorController(ModelController):
+    resource = AuthorResource
+    version = (1, 0)
+
+    model = Author
+    schema = _schema.SchemaDependency('example')
+    mapping = {'id': 'id', 'name': 'name', 'titles': 'titles'}
+    eager_loading = {'titles': ('entries', 'joined')}
+
 class ModelControllerTestCase(TestCase):
+    controller = Controller
+
     def assert_total(self, response, expected):
         self.assertIn('total', response.content)
         self.assertEqual(response.content['total'], expected)
@@ -71,7 +137,7 @@ class ModelControllerTestCase(TestCase):
 
     def _execute_operation(self, request, subject=None, data=None):
         response = ServerResponse()
-        controller = Controller()
+        controller = self.controller()
 
         content = getattr(controller, request)(None, response, subject, data)
         if content and content is not response:
@@ -82,6 +148,24 @@ class ModelControllerTestCase(TestCase):
         ContextLocals.purge()
         return response
 
+    def _capture_statements(self, data=None):
+        statements = []
+        def count_statement(connection, cursor, statement, *args):
+            if statement.lower().startswith('select'):
+                statements.append(statement)
+
+        engine = self.interface.get_engine()
+        event.listen(engine, 'before_cursor_execute', count_statement)
+        try:
+            response = self._execute_operation('query', data=data)
+        finally:
+            event.remove(engine, 'before_cursor_execute', count_statement)
+        return response, statements
+
+    def _count_statements(self, data=None):
+        response, statements = self._capture_statements(data)
+        return response, len(statements)
+
     def _execute_query(self, **filters):
         query = {}
         for key, value in filters.items():
@@ -105,6 +189,57 @@ class TestCRUD(ModelControllerTestCase):
         id = self._create_example()
         self.assertTrue(id)
 
+    def test_batch(self):
+        id = self._create_example()
+        response = self._execute_operation('batch', data={'savepoints': True, 'operations': [
+            {'operation': 'create', 'data': {'name': 'beta', 'value': 2}},
+            {'operation': 'update', 'subject': id, 'data': {'value': 3, 'returning': ['value']}},
+            {'operation': 'delete', 'subject': uniqid()},
+        ]})
+
+        self.assertEqual(response.status, OK)
+        self.assertEqual([result['status'] for result in response.content],
+            [OK, OK, 'NOT_FOUND'])
+        self.assertEqual(response.content[1]['content'], {'id': id, 'value': 3})
+
+class TestLoad(ModelControllerTestCase):
+    def _create_examples(self):
+        self.identifiers = []
+        examples = []
+        for i in range(1200):
+            id = uniqid()
+            self.identifiers.append(id)
+            examples.append({'id': id, 'name': 'example-%d' % i, 'value': i})
+
+        with self.interface.get_engine().begin() as connection:
+            connection.execute(Example.__table__.insert(), *examples)
+
+    def test_load(self):
+        identifiers = list(reversed(self.identifiers))
+        identifiers.insert(3, uniqid())
+
+        response = self._execute_operation('load', data={'identifiers': identifiers})
+        self.assertEqual(response.status, OK)
+        self.assertEqual(len(response.content), 1201)
+        self.assertIsNone(response.content[3])
+
+        for identifier, resource in zip(identifiers, response.content):
+            if resource is not None:
+                self.assertEqual(resource['id'], identifier)
+
+    def test_empty_load(self):
+        response = self._execute_operation('load', data={'identifiers': []})
+        self.assertEqual(response.content, [])
+
+    def test_load_from_session(self):
+        self.interface.dialect.membership_chunk_size = None
+        identifiers = self.identifiers[:3]
+        instances = self.interface.session.query(Example).filter(
+            Example.id.in_(identifiers)).all()
+
+        response = self._execute_operation('load', data={'identifiers': identifiers})
+        self.assertEqual([r['id'] for r in response.content], identifiers)
+
 class TestQuerySorting(ModelControllerTestCase):
     EXAMPLES = [('alpha', 1), ('alpha', 2), ('beta', 1), ('gamma', 3)]
 
@@ -281,3 +416,524 @@ class TestQueryOperatiors(ModelControllerTestCase):
         response = self._execute_query(name__notin=['alpha-one', 'delta'])
         self.assert_total(response, 3)
         self.assert_values(response, 'name', ['alpha-two', 'beta-one', 'gamma-one'])
+
+    def test_combined_operators(self):
+        response = self._execute_query(name__contains='-', value__gte=1, value__lt=3)
+        self.assert_total(response, 2)
+        self.assert_values(response, 'name', ['alpha-two', 'beta-one'])
+
+        response = self._execute_query(name__contains='-', value__gte=2, value__lt=4)
+        self.assert_total(response, 2)
+        self.assert_values(response, 'name', ['beta-one', 'gamma-one'])
+
+    def test_search_operator(self):
+        response = self._execute_query(name__search='ALPHA one')
+        self.assert_total(response, 1)
+        self.assert_values(response, 'name', ['alpha-one'])
+
+        response = self._execute_query(name__search='bad')
+        self.assert_total(response, 0)
+
+    def test_similar_operator(self):
+        response = self._execute_query(name__similar='ALPHA')
+        self.assert_total(response, 2)
+        self.assert_values(response, 'name', ['alpha-one', 'alpha-two'])
+
+        response = self._execute_query(name__similar='a-o')
+        self.assert_values(response, 'name', ['alpha-one', 'beta-one', 'gamma-one'])
+
+    def test_total_strategies(self):
+        response = self._execute_query(name__prefix='alpha', total_strategy='none')
+        self.assertNotIn('total', response.content)
+        self.assert_values(response, 'name', ['alpha-one', 'alpha-two'])
+
+        response = self._execute_query(name__prefix='alpha', total_strategy='estimated')
+        self.assert_total(response, 2)
+
+class KeysetController(Controller):
+    keyset_pagination = True
+
+class StreamingController(Controller):
+    stream_batch_size = 2
+
+class AnnotatedController(Controller):
+    total_cache = Cache(MemoryBackend, 64)
+
+    def _annotate_query(self, request, query, data):
+        if 'minimum' in data:
+            query = query.filter(Example.value >= data['minimum'])
+        return query
+
+class TestQueryTotals(ModelControllerTestCase):
+    def _create_examples(self):
+        examples = []
+        for i in range(5):
+            examples.append({'id': uniqid(), 'name': 'example-%d' % i, 'value': i})
+
+        with self.interface.get_engine().begin() as connection:
+            connection.execute(Example.__table__.insert(), *examples)
+
+    def test_total_strategies(self):
+        for strategy in ('exact', 'cached', 'estimated', 'window'):
+            response = self._execute_query(value__gte=1, limit=2, sort=['value+'],
+                total_strategy=strategy)
+            self.assert_total(response, 4)
+            self.assert_values(response, 'value', [1, 2], True)
+
+        response = self._execute_query(value__gte=1, limit=2, total_strategy='none')
+        self.assertNotIn('total', response.content)
+
+    def test_cached_total_with_annotation(self):
+        self.controller = AnnotatedController
+        cache = self.controller.total_cache
+        cache.clear()
+
+        totals = []
+        for data in ({'minimum': 1}, {'minimum': 3}, {'minimum': 3, 'limit': 1}):
+            data['total_strategy'] = 'cached'
+            response = self._execute_operation('query', data=data)
+            totals.append(response.content['total'])
+
+        self.assertEqual(totals, [4, 2, 2])
+        self.assertEqual(cache.stats()['hits'], 1)
+
+    def test_window_total_beyond_last_row(self):
+        response = self._execute_query(sort=['value+'], offset=10, limit=2,
+            total_strategy='window')
+        self.assert_total(response, 5)
+        self.assertEqual(response.content['resources'], [])
+
+    def test_window_total_with_keyset(self):
+        self.controller = KeysetController
+        totals, values, cursor = [], [], None
+        while True:
+            data = {'sort': ['value+'], 'limit': 2, 'total_strategy': 'window'}
+            if cursor:
+                data['cursor'] = cursor
+
+            response = self._execute_operation('query', data=data)
+            totals.append(response.content['total'])
+            values.extend(r['value'] for r in response.content['resources'])
+
+            cursor = response.content.get('cursor')
+            if not cursor:
+                break
+
+        self.assertEqual(totals, [5, 5, 5])
+        self.assertEqual(values, [0, 1, 2, 3, 4])
+
+    def test_streaming(self):
+        self.controller = StreamingController
+        response = self._execute_query(sort=['value-'], total_strategy='window')
+        self.assert_total(response, 5)
+        self.assert_values(response, 'value', [4, 3, 2, 1, 0], True)
+
+class Shadowed(object):
+    name = property(lambda self: 'attribute')
+
+    def __init__(self, **values):
+        self.__dict__.update(values)
+
+class TestResourceExtraction(ModelControllerTestCase):
+    def _create_examples(self):
+        self.id = uniqid()
+        with self.interface.get_engine().begin() as connection:
+            connection.execute(Example.__table__.insert(), id=self.id, name='alpha', value=1)
+
+    def tearDown(self):
+        ContextLocals.purge()
+        super(TestResourceExtraction, self).tearDown()
+
+    def _construct_resource(self, instance, data=None):
+        return self.controller()._construct_resource(None, instance, data or {})
+
+    def test_instance_dict_read_directly(self):
+        extractor = ResourceExtractor({'id': 'id', 'name': 'name', 'value': 'value'},
+            set(['id', 'name', 'value']))
+        self.assertEqual(extractor(Shadowed(name='dict', value=1), {}),
+            {'name': 'dict', 'value': 1})
+        self.assertEqual(extractor(Shadowed(value=1), {}),
+            {'name': 'attribute', 'value': 1})
+
+    def test_loaded_instance(self):
+        instance = self.interface.session.query(Example).get(self.id)
+        self.assertEqual(self._construct_resource(instance),
+            {'id': self.id, 'name': 'alpha', 'value': 1})
+
+    def test_expired_instance(self):
+        session = self.interface.session
+        instance = session.query(Example).get(self.id)
+        session.commit()
+        self.assertNotIn('value', instance.__dict__)
+
+        self.interface.get_engine().execute(Example.__table__.update().values(value=2))
+        self.assertEqual(self._construct_resource(instance),
+            {'id': self.id, 'name': 'alpha', 'value': 2})
+
+    def test_property_mapping(self):
+        self.controller = EntryController
+        with self.interface.get_engine().begin() as connection:
+            connection.execute(Author.__table__.insert(), id=self.id, name='author')
+            connection.execute(Entry.__table__.insert(), id=uniqid(), author_id=self.id,
+                title='entry')
+
+        instance = self.interface.session.query(Entry).one()
+        resource = self._construct_resource(instance)
+        self.assertEqual((resource['title'], resource['author_name']), ('entry', 'author'))
+
+    def test_partial_fields(self):
+        instance = self.interface.session.query(Example).get(self.id)
+        self.assertEqual(self._construct_resource(instance, {'fields': ['name']}),
+            {'id': self.id, 'name': 'alpha'})
+        self.assertEqual(self._construct_resource(instance, {'exclude': ['name']}),
+            {'id': self.id, 'value': 1})
+        self.assertEqual(self._construct_resource(instance, {'fields': ['id']}),
+            {'id': self.id})
+
+    def test_extractors_bounded(self):
+        controller = self.controller()
+        controller.MAXIMUM_EXTRACTORS = 2
+        controller._extractors.clear()
+
+        instance = self.interface.session.query(Example).get(self.id)
+        for fields in (['name'], ['value'], ['name', 'value'], ['name']):
+            controller._construct_resource(None, instance, {'fields': fields})
+            self.assertLessEqual(len(controller._extractors), 2)
+
+    def test_field_filter_retained(self):
+        controller, data = self.controller(), {'fields': ['name']}
+        fields = controller._get_field_filter(data)
+        self.assertIs(controller._get_field_filter(data), fields)
+        self.assertIsNot(controller._get_field_filter({'fields': ['name']}), fields)
+
+class ProjectingController(Controller):
+    project_fields = True
+
+class TestProjection(ModelControllerTestCase):
+    controller = ProjectingController
+
+    def _create_examples(self):
+        examples = []
+        for i in range(3):
+            examples.append({'id': uniqid(), 'name': 'example-%d' % i, 'value': i})
+
+        with self.interface.get_engine().begin() as connection:
+            connection.execute(Example.__table__.insert(), *examples)
+
+    def _query(self, **data):
+        data.update(sort=['value+'], total_strategy='none')
+        response, statements = self._capture_statements(data)
+        self.assertEqual(len(statements), 1)
+        return response, statements[0].split('FROM')[0]
+
+    def test_projected_fields(self):
+        response, columns = self._query(fields=['id', 'name'])
+        self.assertIn('example.id', columns)
+        self.assertIn('example.name', columns)
+        self.assertNotIn('example.value', columns)
+
+        self.assertEqual(sorted(response.content['resources'][0]), ['id', 'name'])
+        self.assert_values(response, 'name', ['example-0', 'example-1', 'example-2'], True)
+
+    def test_identifier_always_loaded(self):
+        response, columns = self._query(fields=['value'])
+        self.assertIn('example.id', columns)
+        self.assertNotIn('example.name', columns)
+        self.assert_values(response, 'value', [0, 1, 2], True)
+
+    def test_default_fields(self):
+        response, columns = self._query()
+        for column in ('example.id', 'example.name', 'example.value'):
+            self.assertIn(column, columns)
+        self.assert_values(response, 'value', [0, 1, 2], True)
+
+class TestKeysetPagination(ModelControllerTestCase):
+    controller = KeysetController
+    VALUES = [3, None, 1, None, 2, 1]
+
+    def _create_examples(self):
+        examples = []
+        for i, value in enumerate(self.VALUES):
+            examples.append({'id': uniqid(), 'name': 'example-%d' % i, 'value': value})
+
+        with self.interface.get_engine().begin() as connection:
+            connection.execute(Example.__table__.insert(), *examples)
+
+    def _paginate(self, sort, limit=2):
+        values, cursor = [], None
+        while True:
+            data = {'sort': sort, 'limit': limit}
+            if cursor:
+                data['cursor'] = cursor
+
+            response = self._execute_operation('query', data=data)
+            values.extend(r.get('value') for r in response.content['resources'])
+
+            cursor = response.content.get('cursor')
+            if not cursor:
+                return values
+
+    def test_ascending(self):
+        self.assertEqual(self._paginate(['value+']), [1, 1, 2, 3, None, None])
+
+    def test_descending(self):
+        self.assertEqual(self._paginate(['value-']), [None, None, 3, 2, 1, 1])
+
+    def test_cursor_on_null(self):
+        for limit in (1, 3, 5):
+            self.assertEqual(self._paginate(['value+'], limit), [1, 1, 2, 3, None, None])
+            self.assertEqual(self._paginate(['value-'], limit), [None, None, 3, 2, 1, 1])
+
+    def test_multiple_keys(self):
+        self.assertEqual(self._paginate(['value-', 'name+']), [None, None, 3, 2, 1, 1])
+
+class CachedController(Controller):
+    result_cache = Cache(MemoryBackend, 64)
+
+class TestResultCache(ModelControllerTestCase):
+    controller = CachedController
+
+    def _create_examples(self):
+        self.controller.result_cache.clear()
+        self.identifiers = []
+        for i in range(3):
+            response = self._execute_operation('create', data={'name': 'example-%d' % i,
+                'value': i})
+            self.identifiers.append(response.content['id'])
+
+    def _update_example(self, id, data):
+        subject = self.controller().acquire(id)
+        return self._execute_operation('update', subject, data)
+
+    def test_cached_query(self):
+        cache = self.controller.result_cache
+        first = self._execute_query(sort=['value+'])
+        hits = cache.stats()['hits']
+
+        second = self._execute_query(sort=['value+'])
+        self.assertEqual(cache.stats()['hits'], hits + 1)
+        self.assertEqual(second.content, first.content)
+
+        second.content['resources'][0]['value'] = 10
+        third = self._execute_query(sort=['value+'])
+        self.assertEqual(third.content, first.content)
+        self.assertIsNot(third.content, second.content)
+
+    def test_invalidation(self):
+        self.assert_values(self._execute_query(sort=['value+']), 'value', [0, 1, 2], True)
+        self._update_example(self.identifiers[0], {'value': 5})
+        self.assert_values(self._execute_query(sort=['value+']), 'value', [1, 2, 5], True)
+
+        self._execute_operation('delete', self.controller().acquire(self.identifiers[1]))
+        self.assert_values(self._execute_query(sort=['value+']), 'value', [2, 5], True)
+
+    def test_uncommitted_changes_not_invalidated(self):
+        cache, controller = self.controller.result_cache, self.controller()
+        namespace = controller._get_cache_namespace()
+
+        response = self._execute_query(sort=['value+'])
+        generation = cache.get_generation(namespace)
+
+        subject = controller.acquire(self.identifiers[0])
+        controller._invalidate_caches(subject.session, [subject])
+        subject.session.rollback()
+        ContextLocals.purge()
+
+        self.assertEqual(cache.get_generation(namespace), generation)
+        self.assertEqual(self._execute_query(sort=['value+']).content, response.content)
+
+class EntityCachedController(Controller):
+    entity_cache = Cache(MemoryBackend, 64)
+
+class TestEntityCache(ModelControllerTestCase):
+    controller = EntityCachedController
+
+    def _create_examples(self):
+        self.controller.entity_cache.clear()
+        self.identifiers = []
+        for i in range(2):
+            response = self._execute_operation('create', data={'name': 'example-%d' % i,
+                'value': i})
+            self.identifiers.append(response.content['id'])
+
+    def _acquire(self, id):
+        instance = self.controller().acquire(id)
+        ContextLocals.purge()
+        return instance
+
+    def test_cached_entity(self):
+        cache, id = self.controller.entity_cache, self.identifiers[0]
+        self.assertEqual(self._acquire(id).value, 0)
+        hits = cache.stats()['hits']
+
+        self.assertEqual(self._acquire(id).value, 0)
+        self.assertEqual(cache.stats()['hits'], hits + 1)
+        self.assertIsNone(self._acquire(uniqid()))
+
+    def test_invalidation(self):
+        id = self.identifiers[0]
+        self.assertEqual(self._acquire(id).value, 0)
+
+        subject = self.controller().acquire(id)
+        self._execute_operation('update', subject, {'value': 5})
+        self.assertEqual(self._acquire(id).value, 5)
+
+    def test_entity_invalidated_while_loading(self):
+        cache, id = self.controller.entity_cache, self.identifiers[0]
+        controller, entries = self.controller(), []
+
+        def set(key, value, timeout=None):
+            if not entries:
+                # the entity is changed elsewhere after being loaded but before being cached
+                cache.advance_generation(controller._get_entity_generation_namespace(key))
+            entries.append(key)
+            Cache.set(cache, key, value, timeout)
+
+        cache.set = set
+        try:
+            self._acquire(id)
+            self._acquire(id)
+            self._acquire(id)
+        finally:
+            del cache.set
+        self.assertEqual(len(entries), 2)
+
+class TestEagerLoading(ModelControllerTestCase):
+    controller = EntryController
+
+    def _create_examples(self):
+        authors, entries = [], []
+        for i in range(100):
+            authors.append({'id': uniqid(), 'name': 'author-%d' % i})
+            entries.append({'id': uniqid(), 'author_id': authors[-1]['id'],
+                'title': 'entry-%d' % i})
+
+        with self.interface.get_engine().begin() as connection:
+            connection.execute(Author.__table__.insert(), *authors)
+            connection.execute(Entry.__table__.insert(), *entries)
+
+    def test_joined_loading(self):
+        response, statements = self._count_statements()
+        self.assertEqual(statements, 2)
+        self.assertEqual(len(response.content['resources']), 100)
+        for resource in response.content['resources']:
+            self.assertEqual(resource['author_name'].split('-')[1],
+                resource['title'].split('-')[1])
+
+    def test_selectin_loading(self):
+        EntryController.eager_loading = {'author_name': ('author', 'selectin')}
+        try:
+            response, statements = self._count_statements()
+        finally:
+            EntryController.eager_loading = {'author_name': ('author', 'joined')}
+
+        self.assertEqual(statements, 3)
+        self.assertEqual(len(response.content['resources']), 100)
+
+    def test_excluded_field(self):
+        response, statements = self._count_statements({'exclude': ['author_name']})
+        self.assertEqual(statements, 2)
+        self.assertNotIn('author_name', response.content['resources'][0])
+
+class StreamingAuthorController(AuthorController):
+    stream_batch_size = 2
+
+class TestCollectionEagerLoading(ModelControllerTestCase):
+    controller = AuthorController
+
+    def _create_examples(self):
+        authors, entries = [], []
+        for i in range(5):
+            authors.append({'id': uniqid(), 'name': 'author-%d' % i})
+            for j in range(3):
+                entries.append({'id': uniqid(), 'author_id': authors[-1]['id'],
+                    'title': 'entry-%d-%d' % (i, j)})
+
+        with self.interface.get_engine().begin() as connection:
+            connection.execute(Author.__table__.insert(), *authors)
+            connection.execute(Entry.__table__.insert(), *entries)
+
+    def assert_titles(self, response):
+        for resource in response.content['resources']:
+            i = resource['name'].split('-')[1]
+            self.assertEqual(resource['titles'], ['entry-%s-%d' % (i, j) for j in range(3)])
+
+    def test_joined_loading(self):
+        response, statements = self._count_statements({'sort': ['name+']})
+        self.assertEqual(statements, 2)
+        self.assert_values(response, 'name', ['author-%d' % i for i in range(5)], True)
+        self.assert_titles(response)
+
+    def test_window_total(self):
+        response, statements = self._count_statements({'sort': ['name+'], 'limit': 2,
+            'total_strategy': 'window'})
+        self.assertEqual(statements, 2)
+        self.assert_total(response, 5)
+        self.assert_values(response, 'name', ['author-0', 'author-1'], True)
+        self.assert_titles(response)
+
+    def test_streaming(self):
+        self.controller = StreamingAuthorController
+        response, statements = self._count_statements({'sort': ['name-']})
+        self.assertEqual(statements, 3)
+        self.assert_values(response, 'name', ['author-%d' % i for i in range(4, -1, -1)], True)
+        self.assert_titles(response)
+
+class PolymorphicAuthorController(AuthorController):
+    mapping = None
+    polymorphic_on = 'name'
+    polymorphic_mapping = {
+        'author-0': {'id': 'id', 'name': 'name', 'titles': 'titles'},
+        'author-1': {'id': 'id', 'name': 'name', 'titles': 'titles'},
+    }
+
+class ResolvedAuthorController(PolymorphicAuthorController):
+    polymorphic_mapping = {
+        'author-0': {'id': 'id', 'name': 'name', 'entries': 'entries'},
+        'author-1': {'id': 'id', 'name': 'name', 'entries': 'entries'},
+    }
+    eager_loading = {'entries': 'subquery'}
+
+class TestPolymorphicEagerLoading(ModelControllerTestCase):
+    controller = PolymorphicAuthorController
+
+    def _create_examples(self):
+        authors, entries = [], []
+        for i in range(2):
+            authors.append({'id': uniqid(), 'name': 'author-%d' % i})
+            for j in range(3):
+                entries.append({'id': uniqid(), 'author_id': authors[-1]['id'],
+                    'title': 'entry-%d-%d' % (i, j)})
+
+        with self.interface.get_engine().begin() as connection:
+            connection.execute(Author.__table__.insert(), *authors)
+            connection.execute(Entry.__table__.insert(), *entries)
+
+    def test_joined_loading(self):
+        response, statements = self._count_statements()
+        self.assertEqual(statements, 2)
+        for resource in response.content['resources']:
+            i = resource['name'].split('-')[1]
+            self.assertEqual(resource['titles'], ['entry-%s-%d' % (i, j) for j in range(3)])
+
+    def test_strategy_declaration_resolved(self):
+        controller = ResolvedAuthorController
+        self.assertEqual(controller.eager_loading, {'entries': ('entries', 'subquery')})
+
+        query = controller()._construct_eager_loading(Query(Author), ['entries'])
+        self.assertEqual(len(query._with_options), 1)
+
+    def test_ambiguous_strategy_declaration(self):
+        controller = ResolvedAuthorController
+        controller.polymorphic_mapping['author-1']['entries'] = 'titles'
+        controller.eager_loading = {'entries': 'joined'}
+        try:
+            with self.assertRaises(ConfigurationError):
+                controller.__construct__()
+
+            controller.eager_loading = {'entries': ('entries', 'joined')}
+            controller.__construct__()
+            self.assertEqual(controller.eager_loading, {'entries': ('entries', 'joined')})
+        finally:
+            controller.polymorphic_mapping['author-1']['entries'] = 'entries'
+            controller.eager_loading = {'entries': ('entries', 'subquery')}
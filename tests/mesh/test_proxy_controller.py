@@ -0,0 +1,142 @@
+from threading import Lock, Thread
+
+from unittest2 import TestCase
+
+import scheme
+from mesh.standard import *
+from mesh.transport.base import ServerResponse
+
+from spire.core import *
+from spire.local import ContextLocals
+from spire.mesh.controllers import ProxyController
+from spire.mesh.units import ContextLocal
+from spire.support.cache import Cache, MemoryBackend
+
+class Results(list):
+    status = OK
+
+    @property
+    def total(self):
+        return len(self)
+
+class ProxyQuery(object):
+    def __init__(self, results):
+        self.results = results
+
+    def all(self):
+        return Results(self.results)
+
+class ProxyModel(object):
+    calls = []
+    guard = Lock()
+
+    def __init__(self, id):
+        self.id = id
+        self.name = 'proxy-%d' % id
+
+    @classmethod
+    def get(cls, id):
+        cls._record('get', id)
+        return cls(id)
+
+    @classmethod
+    def load(cls, identifiers):
+        cls._record('load', sorted(identifiers))
+        return [cls(id) for id in identifiers]
+
+    @classmethod
+    def query(cls, **params):
+        cls._record('query', params)
+        return ProxyQuery([cls(1), cls(2)])
+
+    @classmethod
+    def _record(cls, operation, value):
+        with cls.guard:
+            cls.calls.append((operation, value, ContextLocal.get()))
+
+class ProxyResource(Resource):
+    name = 'proxy'
+    version = 1
+
+    class schema:
+        id = scheme.Integer(nonnull=True)
+        name = scheme.Token(nonempty=True)
+
+class Controller(ProxyController):
+    resource = ProxyResource
+    version = (1, 0)
+
+    proxy_model = ProxyModel
+    mapping = {'id': 'id', 'name': 'name'}
+
+class BatchingController(Controller):
+    batch_size = 2
+    batch_window = 5
+
+class CachingController(Controller):
+    coalesce_requests = True
+    response_cache = Cache(MemoryBackend, 64)
+
+class ProxyControllerTestCase(TestCase):
+    def setUp(self):
+        self.assembly = Assembly().promote()
+        ProxyModel.calls = []
+
+    def tearDown(self):
+        ContextLocals.purge()
+        self.assembly.demote()
+
+    def _execute_query(self, controller, data=None):
+        response = ServerResponse()
+        controller().query(None, response, None, data)
+        return response
+
+class TestBatching(ProxyControllerTestCase):
+    def test_batches_scoped_to_context(self):
+        acquired, threads = [], []
+        def acquire(subject, context):
+            ContextLocal.push(context)
+            acquired.append(BatchingController().acquire(subject))
+
+        for subject, tenant in ((1, 'a'), (2, 'b'), (3, 'a'), (4, 'b')):
+            threads.append(Thread(target=acquire, args=(subject, {'tenant': tenant})))
+            threads[-1].start()
+        for thread in threads:
+            thread.join(10)
+
+        self.assertEqual(sorted(proxy.id for proxy in acquired), [1, 2, 3, 4])
+        self.assertEqual(sorted(ProxyModel.calls), [('load', [1, 3], {'tenant': 'a'}),
+            ('load', [2, 4], {'tenant': 'b'})])
+
+class TestResponseCache(ProxyControllerTestCase):
+    def setUp(self):
+        super(TestResponseCache, self).setUp()
+        CachingController.response_cache.clear()
+
+    def test_cached_query(self):
+        first = self._execute_query(CachingController, {})
+        self.assertEqual(first.content['total'], 2)
+        self.assertEqual([r['name'] for r in first.content['resources']],
+            ['proxy-1', 'proxy-2'])
+
+        first.content['resources'][0]['name'] = 'changed'
+        second = self._execute_query(CachingController, {})
+        self.assertEqual(second.content['resources'][0]['name'], 'proxy-1')
+        self.assertEqual(len(ProxyModel.calls), 1)
+
+    def test_invalidation(self):
+        self._execute_query(CachingController, {})
+        CachingController()._invalidate_responses()
+        self._execute_query(CachingController, {})
+        self.assertEqual(len(ProxyModel.calls), 2)
+
+    def test_cache_scoped_to_context(self):
+        for tenant in ('a', 'b', 'a'):
+            ContextLocal.push({'tenant': tenant})
+            try:
+                self._execute_query(CachingController, {})
+            finally:
+                ContextLocal.pop()
+
+        self.assertEqual([call[2] for call in ProxyModel.calls],
+            [{'tenant': 'a'}, {'tenant': 'b'}])
@@ -0,0 +1,147 @@
+import os
+
+from sqlalchemy.dialects.postgresql.psycopg2 import PGDialect_psycopg2
+from unittest2 import TestCase
+
+from spire.core import Assembly
+from spire import schema as _schema
+from spire.schema.dialect import PostgresqlDialect
+
+class Record(_schema.Model):
+    class meta:
+        schema = 'bulktest'
+
+    id = _schema.Integer(nullable=False, primary_key=True)
+    name = _schema.Token(nullable=False)
+    value = _schema.Integer(default=7)
+
+class Tagged(_schema.Model):
+    class meta:
+        schema = 'bulktest'
+
+    id = _schema.Integer(nullable=False, primary_key=True)
+    tags = _schema.Array(_schema.TextType())
+
+class BulkTestCase(TestCase):
+    def setUp(self):
+        self.assembly = Assembly().promote()
+        self.assembly.configure({'schema:bulktest': {'url': 'sqlite:////tmp/spire-test-bulk.db'}})
+
+        self.interface = _schema.Schema.interface('bulktest')
+        Record.__table__.create(self.interface.get_engine())
+        self.session = self.interface.get_session(True)
+
+    def tearDown(self):
+        self.session.close()
+        self.interface.purge()
+        self.assembly.demote()
+        os.unlink('/tmp/spire-test-bulk.db')
+
+    def _get_records(self):
+        return [(r.id, r.name, r.value) for r in self.session.query(Record).order_by('id')]
+
+class TestBulkInsert(BulkTestCase):
+    def test_insert(self):
+        count = Record.bulk_insert(self.session, [{'id': 1, 'name': 'a', 'value': 1},
+            {'id': 2, 'name': 'b'}, {'id': 3, 'name': 'c', 'value': None}])
+        self.session.commit()
+
+        self.assertEqual(count, 3)
+        self.assertEqual(self._get_records(), [(1, 'a', 1), (2, 'b', 7), (3, 'c', 7)])
+
+    def test_insert_in_chunks(self):
+        rows = [{'id': i, 'name': 'n%d' % i} for i in range(5)]
+        self.assertEqual(Record.bulk_insert(self.session, rows, chunk_size=2), 5)
+        self.session.commit()
+        self.assertEqual(len(self._get_records()), 5)
+
+    def test_insert_nothing(self):
+        self.assertEqual(Record.bulk_insert(self.session, []), 0)
+
+    def test_missing_required_value(self):
+        with self.assertRaises(ValueError):
+            Record.bulk_insert(self.session, [{'id': 1}])
+
+class TestBulkUpsert(BulkTestCase):
+    def setUp(self):
+        super(TestBulkUpsert, self).setUp()
+        Record.bulk_insert(self.session, [{'id': 1, 'name': 'a', 'value': 1},
+            {'id': 2, 'name': 'b', 'value': 3}])
+        self.session.commit()
+
+    def test_upsert(self):
+        count = Record.bulk_upsert(self.session, [{'id': 2, 'name': 'bb', 'value': 4},
+            {'id': 3, 'name': 'c'}])
+        self.session.commit()
+
+        self.assertEqual(count, 2)
+        self.assertEqual(self._get_records(), [(1, 'a', 1), (2, 'bb', 4), (3, 'c', 7)])
+
+    def test_upsert_preserves_unsupplied_columns(self):
+        Record.bulk_upsert(self.session, [{'id': 1, 'name': 'aa', 'value': 5},
+            {'id': 2, 'name': 'bb'}, {'id': 3, 'name': 'c'}])
+        self.session.commit()
+        self.assertEqual(self._get_records(), [(1, 'aa', 5), (2, 'bb', 3), (3, 'c', 7)])
+
+    def test_upsert_explicit_update(self):
+        Record.bulk_upsert(self.session, [{'id': 1, 'name': 'aa', 'value': 5}],
+            update='value')
+        self.session.commit()
+        self.assertEqual(self._get_records(), [(1, 'a', 5), (2, 'b', 3)])
+
+    def test_upsert_without_update(self):
+        Record.bulk_upsert(self.session, [{'id': 1, 'name': 'aa'}, {'id': 3, 'name': 'c'}],
+            update=[])
+        self.session.commit()
+        self.assertEqual(self._get_records(), [(1, 'a', 1), (2, 'b', 3), (3, 'c', 7)])
+
+    def test_conflict_column_required(self):
+        with self.assertRaises(ValueError):
+            Record.bulk_upsert(self.session, [{'id': 1, 'name': 'aa'}], conflict='value')
+
+class Cursor(object):
+    def __init__(self, connection):
+        self.connection = connection
+
+    def close(self):
+        pass
+
+    def copy_expert(self, sql, buffer):
+        self.connection.copied.append((sql, buffer.read()))
+
+class Connection(object):
+    dialect = PGDialect_psycopg2()
+
+    def __init__(self):
+        self.connection = self
+        self.copied = []
+        self.executed = []
+
+    def cursor(self):
+        return Cursor(self)
+
+    def execute(self, statement, rows):
+        self.executed.append(rows)
+
+class TestPostgresqlCopy(TestCase):
+    def setUp(self):
+        self.dialect = PostgresqlDialect(PGDialect_psycopg2)
+
+    def test_copy(self):
+        connection, table = Connection(), Record.__table__
+        self.dialect.bulk_insert(connection, table, list(table.columns),
+            [{'id': 1, 'name': u'caf\xe9', 'value': None}, {'id': 2, 'name': 'a"b', 'value': 3}],
+            copy=True)
+
+        self.assertEqual(connection.executed, [])
+        sql, data = connection.copied[0]
+        self.assertTrue(sql.startswith('copy record (id, name, value) from stdin'))
+        self.assertEqual(data, '"1","caf\xc3\xa9",\\N\n"2","a""b","3"\n')
+
+    def test_adapted_values_inserted_without_copy(self):
+        connection, table = Connection(), Tagged.__table__
+        rows = [{'id': 1, 'tags': None}, {'id': 2, 'tags': ['a', 'b']}]
+        self.dialect.bulk_insert(connection, table, list(table.columns), rows, copy=True)
+
+        self.assertEqual(connection.copied, [])
+        self.assertEqual(connection.executed, [rows])
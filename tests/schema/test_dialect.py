@@ -0,0 +1,59 @@
+import json
+
+from sqlalchemy.dialects.postgresql.psycopg2 import PGDialect_psycopg2
+from sqlalchemy.sql import select
+from unittest2 import TestCase
+
+from spire import schema as _schema
+from spire.schema.dialect import Explain, PostgresqlDialect
+
+class Event(_schema.Model):
+    class meta:
+        schema = 'dialecttest'
+
+    id = _schema.Integer(nullable=False, primary_key=True)
+
+class Result(object):
+    def __init__(self, value):
+        self.value = value
+
+    def scalar(self):
+        return self.value
+
+class Connection(object):
+    dialect = PGDialect_psycopg2()
+
+    def __init__(self, plan):
+        self.plan = plan
+        self.executed = []
+
+    def execute(self, statement):
+        self.executed.append(statement)
+        return Result(json.dumps(self.plan))
+
+class Session(object):
+    def __init__(self, connection):
+        self.connection = lambda clause: connection
+
+class Query(object):
+    def __init__(self, statement):
+        self.statement = statement
+
+class TestPostgresqlEstimate(TestCase):
+    def test_estimate_count(self):
+        connection = Connection([{'Plan': {'Plan Rows': 42}}])
+        statement = select([Event.id]).where(Event.id > 3)
+
+        dialect = PostgresqlDialect(PGDialect_psycopg2)
+        self.assertEqual(dialect.estimate_count(Session(connection), Query(statement)), 42)
+
+        explain, = connection.executed
+        self.assertIsInstance(explain, Explain)
+        self.assertIs(explain.statement, statement)
+
+    def test_explain(self):
+        statement = select([Event.id]).where(Event.id > 3)
+        compiled = Explain(statement).compile(dialect=PGDialect_psycopg2())
+        self.assertEqual(' '.join(str(compiled).split()),
+            'explain (format json) SELECT event.id FROM event WHERE event.id > %(id_1)s')
+        self.assertEqual(compiled.params, {'id_1': 3})
@@ -0,0 +1,113 @@
+import os
+from glob import glob
+from threading import Event, Thread
+
+from unittest2 import TestCase
+
+from spire.core import Assembly
+from spire.schema import Schema
+from spire.schema.dialect import Dialect
+
+URL = 'sqlite:////tmp/spire-test-engine-%(n)s.db'
+
+Schema('enginetest')
+
+class EngineCacheTestCase(TestCase):
+    configuration = {}
+
+    def setUp(self):
+        self.assembly = Assembly().promote()
+        self.assembly.configure({'schema:enginetest': dict(self.configuration, url=URL)})
+
+        # the sqlite dialect does not pool file connections, so the generic dialect is
+        # used to give each engine a queue pool whose checkouts can be observed
+        self.interface = Schema.interface('enginetest')
+        self.interface.dialect = Dialect(self.interface.dialect.dialect)
+
+    def tearDown(self):
+        self.interface.purge()
+        self.assembly.demote()
+        for filename in glob('/tmp/spire-test-engine-*.db'):
+            os.unlink(filename)
+
+class TestEngineEviction(EngineCacheTestCase):
+    configuration = {'maximum_engines': 2}
+
+    def test_least_recently_used_engine_evicted(self):
+        interface = self.interface
+        first, second = interface.get_engine(n=1), interface.get_engine(n=2)
+        self.assertIs(interface.get_engine(n=1), first)
+
+        interface.get_engine(n=3)
+        self.assertIs(interface.get_engine(n=1), first)
+        self.assertIsNot(interface.get_engine(n=2), second)
+
+        statistics = interface.get_cache_statistics()
+        self.assertEqual(statistics['engines'], 2)
+        self.assertEqual(statistics['evictions'], 2)
+        self.assertEqual(statistics['hits'], 2)
+        self.assertEqual(statistics['misses'], 4)
+
+    def test_engines_in_use_retired(self):
+        interface = self.interface
+        engine = interface.get_engine(n=1)
+        connection = engine.connect()
+
+        interface.get_engine(n=2)
+        interface.get_engine(n=3)
+        self.assertEqual(interface.get_cache_statistics()['retired'], 1)
+        self.assertEqual(connection.execute('select 1').scalar(), 1)
+
+        connection.close()
+        interface._sweep_engines(0)
+        self.assertEqual(interface.get_cache_statistics()['retired'], 0)
+
+class TestIdleEngines(EngineCacheTestCase):
+    configuration = {'engine_idle_timeout': 60}
+
+    def test_idle_engines_evicted(self):
+        interface = self.interface
+        first, second = interface.get_engine(n=1), interface.get_engine(n=2)
+
+        interface.accessed[URL % {'n': 1}] -= 120
+        interface._sweep_engines(interface.accessed[URL % {'n': 2}])
+        self.assertEqual(interface.get_cache_statistics()['engines'], 1)
+        self.assertIs(interface.get_engine(n=2), second)
+        self.assertIsNot(interface.get_engine(n=1), first)
+
+class TestEngineWarmup(EngineCacheTestCase):
+    configuration = {'pool_size': 2, 'pool_warmup': 2}
+
+    def test_warmup_outside_guard(self):
+        interface, started, release = self.interface, Event(), Event()
+        engine = interface.get_engine(n=1)
+        self.assertEqual(engine.pool.checkedin(), 2)
+
+        connect = Dialect.create_engine
+        def create_engine(dialect, url, schema, **params):
+            params['connect_args'] = {'check_same_thread': False}
+            engine = connect(dialect, url, schema, **params)
+            if url.endswith('-2.db'):
+                creator = engine.pool._creator
+                def blocking_creator():
+                    started.set()
+                    release.wait(5)
+                    return creator()
+                engine.pool._creator = blocking_creator
+            return engine
+
+        interface.dialect.create_engine = create_engine.__get__(interface.dialect)
+        thread = Thread(target=interface.get_engine, kwargs={'n': 2})
+        thread.start()
+
+        acquired = []
+        try:
+            self.assertTrue(started.wait(5))
+            other = Thread(target=lambda: acquired.append(interface.get_engine(n=1)))
+            other.start()
+            other.join(1)
+            self.assertEqual(acquired, [engine])
+        finally:
+            release.set()
+            thread.join(5)
+        self.assertEqual(interface.get_engine(n=2).pool.checkedin(), 2)
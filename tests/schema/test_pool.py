@@ -0,0 +1,100 @@
+import os
+
+from unittest2 import TestCase
+
+from spire.core import Assembly
+from spire.schema import Schema
+from spire.schema.dialect import Dialect, get_dialect
+from spire.schema.pool import InstrumentedQueuePool, warm_engine
+
+URL = 'sqlite:////tmp/spire-test-pool.db'
+
+Schema('pooltest')
+
+def create_engine(pre_ping=False, **params):
+    dialect = Dialect(get_dialect(URL).dialect)
+    return dialect.create_engine(URL, None, pre_ping=pre_ping, **params)
+
+class TestInstrumentedQueuePool(TestCase):
+    def tearDown(self):
+        if os.path.exists('/tmp/spire-test-pool.db'):
+            os.unlink('/tmp/spire-test-pool.db')
+
+    def test_pool_params(self):
+        engine = create_engine(pool_size=3, max_overflow=1, pool_timeout=None)
+        self.assertIsInstance(engine.pool, InstrumentedQueuePool)
+        self.assertEqual(engine.pool.size(), 3)
+        self.assertEqual(engine.pool._max_overflow, 1)
+
+    def test_describe(self):
+        engine = create_engine(pool_size=2)
+        first, second = engine.connect(), engine.connect()
+
+        description = engine.pool.describe()
+        self.assertEqual(description['checkouts'], 2)
+        self.assertEqual(description['checked_out'], 2)
+        self.assertEqual(description['size'], 2)
+        self.assertTrue(description['maximum_wait'] <= description['wait_time'])
+
+        first.close()
+        second.close()
+        self.assertEqual(engine.pool.describe()['checked_out'], 0)
+
+    def test_warm_engine(self):
+        engine = create_engine(pool_size=3)
+        warm_engine(engine, 3)
+        self.assertEqual(engine.pool.checkedin(), 3)
+        self.assertEqual(engine.pool.checkedout(), 0)
+
+    def test_pre_ping_replaces_stale_connections(self):
+        engine = create_engine(pre_ping=True, pool_size=1)
+        connection = engine.connect()
+        stale = connection.connection.connection
+        connection.close()
+        stale.close()
+
+        connection = engine.connect()
+        self.assertIsNot(connection.connection.connection, stale)
+        self.assertEqual(connection.execute('select 1').scalar(), 1)
+        connection.close()
+
+class TestForkProtection(TestCase):
+    def setUp(self):
+        self.assembly = Assembly().promote()
+        self.assembly.configure({'schema:pooltest': {'url': URL}})
+        self.interface = Schema.interface('pooltest')
+
+    def tearDown(self):
+        self.interface.purge()
+        self.assembly.demote()
+        if os.path.exists('/tmp/spire-test-pool.db'):
+            os.unlink('/tmp/spire-test-pool.db')
+
+    def test_connections_tagged_with_pid(self):
+        engine = create_engine(pool_size=1)
+        connection = engine.connect()
+        self.assertEqual(connection.connection._connection_record.info['pid'], os.getpid())
+        connection.close()
+
+    def test_connections_of_other_processes_discarded(self):
+        engine = create_engine(pool_size=1)
+        connection = engine.connect()
+        inherited = connection.connection.connection
+        connection.connection._connection_record.info['pid'] = os.getpid() + 1
+        connection.close()
+
+        connection = engine.connect()
+        self.assertIsNot(connection.connection.connection, inherited)
+        self.assertEqual(connection.connection._connection_record.info['pid'], os.getpid())
+        connection.close()
+
+        # the inherited connection is left open for the process which opened it
+        self.assertEqual(inherited.execute('select 1').fetchone(), (1,))
+        inherited.close()
+
+    def test_engines_replaced_after_fork(self):
+        engine = self.interface.get_engine()
+        self.interface._reset_after_fork()
+
+        self.assertIsNot(self.interface.get_engine(), engine)
+        self.assertEqual(self.interface.inherited[0][0], engine)
@@ -0,0 +1,112 @@
+import os
+
+from unittest2 import TestCase
+
+from spire.core import Assembly
+from spire import schema as _schema
+from spire.schema.schema import ReplicaRouter, RoutingSession
+
+PRIMARY = '/tmp/spire-test-primary.db'
+REPLICA = '/tmp/spire-test-replica.db'
+
+class Item(_schema.Model):
+    class meta:
+        schema = 'routingtest'
+
+    id = _schema.Integer(nullable=False, primary_key=True)
+    name = _schema.Token(nullable=False)
+
+class StubEngine(object):
+    def __init__(self, checkedout):
+        self.pool = self
+        self.connections = checkedout
+
+    def checkedout(self):
+        return self.connections
+
+class TestReplicaRouter(TestCase):
+    def test_round_robin(self):
+        first, second = StubEngine(0), StubEngine(0)
+        router = ReplicaRouter([first, second])
+        self.assertEqual([router.select() for i in range(3)], [first, second, first])
+
+    def test_least_connections(self):
+        first, second = StubEngine(2), StubEngine(1)
+        router = ReplicaRouter([first, second], 'least-connections')
+        self.assertIs(router.select(), second)
+
+        second.connections = 3
+        self.assertIs(router.select(), first)
+
+class TestRoutingSession(TestCase):
+    def setUp(self):
+        self.assembly = Assembly().promote()
+        self.assembly.configure({'schema:routingtest': {
+            'url': 'sqlite:///' + PRIMARY,
+            'replicas': ['sqlite:///' + REPLICA],
+        }})
+
+        self.interface = _schema.Schema.interface('routingtest')
+        self.primary = self.interface.get_engine()
+        self.replica = self.interface.get_session(True).router.engines[0]
+
+        for engine, name in ((self.primary, 'primary'), (self.replica, 'replica')):
+            Item.__table__.create(engine)
+            engine.execute(Item.__table__.insert(), {'id': 1, 'name': name})
+
+    def tearDown(self):
+        self.interface.purge()
+        self.assembly.demote()
+        for filename in (PRIMARY, REPLICA):
+            if os.path.exists(filename):
+                os.unlink(filename)
+
+    def test_reads_routed_to_replica(self):
+        session = self.interface.get_session(True)
+        self.assertIsInstance(session, RoutingSession)
+        self.assertEqual(session.query(Item).get(1).name, 'replica')
+        self.assertIs(session.replica, self.replica)
+        session.close()
+
+    def test_writes_pin_session_to_primary(self):
+        session = self.interface.get_session(True)
+        self.assertEqual(session.query(Item.name).scalar(), 'replica')
+
+        session.add(Item(id=2, name='added'))
+        session.flush()
+        self.assertTrue(session.sticky)
+        self.assertEqual(sorted(name for name, in session.query(Item.name)),
+            ['added', 'primary'])
+
+        session.commit()
+        self.assertEqual(session.query(Item).get(1).name, 'primary')
+        session.close()
+
+        self.assertEqual(self.primary.execute('select count(*) from item').scalar(), 2)
+        self.assertEqual(self.replica.execute('select count(*) from item').scalar(), 1)
+
+    def test_statements_pin_session_to_primary(self):
+        session = self.interface.get_session(True)
+        session.execute(Item.__table__.update().values(name='updated'))
+        self.assertTrue(session.sticky)
+        self.assertEqual(session.query(Item.name).scalar(), 'updated')
+        session.close()
+
+    def test_locking_reads_routed_to_primary(self):
+        session = self.interface.get_session(True)
+        self.assertEqual(session.query(Item.name).with_for_update().scalar(), 'primary')
+        self.assertTrue(session.sticky)
+        self.assertEqual(session.query(Item.name).scalar(), 'primary')
+        session.close()
+
+    def test_close_releases_pin(self):
+        session = self.interface.get_session(True)
+        session.add(Item(id=2, name='added'))
+        session.commit()
+        self.assertTrue(session.sticky)
+
+        session.close()
+        self.assertFalse(session.sticky)
+        self.assertIsNone(session.replica)
+        self.assertEqual(session.query(Item.name).scalar(), 'replica')
+        session.close()
@@ -0,0 +1,96 @@
+import os
+
+from sqlalchemy import create_engine
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateIndex, CreateTable
+from unittest2 import TestCase
+
+from spire.core import Assembly
+from spire import schema as _schema
+from spire.schema.fields import SearchIndex, SearchMatch, SimilarMatch, TrigramIndex
+
+FILENAME = '/tmp/spire-test-search.db'
+
+class Document(_schema.Model):
+    class meta:
+        schema = 'searchtest'
+        indexes = [SearchIndex('document_search', 'search'),
+            TrigramIndex('document_title_trigram', 'title')]
+
+    id = _schema.Integer(nullable=False, primary_key=True)
+    title = _schema.Text(nullable=False)
+    body = _schema.Text()
+    search = _schema.TextSearch('title body', config='simple')
+
+def compile_postgresql(element):
+    return ' '.join(str(element.compile(dialect=postgresql.dialect())).split())
+
+class TestPostgresqlSearch(TestCase):
+    def test_table(self):
+        self.assertIn('search TSVECTOR', compile_postgresql(CreateTable(Document.__table__)))
+
+    def test_indexes(self):
+        indexes = dict((index.name, index) for index in Document.__table__.indexes)
+        self.assertEqual(compile_postgresql(CreateIndex(indexes['document_search'])),
+            'CREATE INDEX document_search ON document USING gin (search)')
+        self.assertEqual(compile_postgresql(CreateIndex(indexes['document_title_trigram'])),
+            'CREATE INDEX document_title_trigram ON document USING gin (title gin_trgm_ops)')
+
+    def test_trigger(self):
+        statements = []
+        def execute(statement, *args, **params):
+            statements.append(' '.join(str(statement.compile(dialect=engine.dialect)).split()))
+
+        engine = create_engine('postgresql://', strategy='mock', executor=execute)
+        Document.__table__.create(engine)
+        self.assertEqual(statements[-1], 'create trigger document_search_search before insert'
+            ' or update on document for each row execute procedure'
+            " tsvector_update_trigger(search, 'pg_catalog.simple', title, body)")
+
+    def test_search_document(self):
+        self.assertEqual(compile_postgresql(SearchMatch(Document.search, 'alpha beta')),
+            "document.search @@ plainto_tsquery('simple', %(param_1)s)")
+
+    def test_search_text(self):
+        self.assertEqual(compile_postgresql(SearchMatch(Document.title, 'alpha')),
+            "to_tsvector('english', document.title) @@"
+            " plainto_tsquery('english', %(param_1)s)")
+
+    def test_similar(self):
+        self.assertEqual(compile_postgresql(SimilarMatch(Document.title, 'alpha')),
+            'document.title %% %(param_1)s')
+
+class TestSearchFallback(TestCase):
+    def setUp(self):
+        self.assembly = Assembly().promote()
+        self.assembly.configure({'schema:searchtest': {'url': 'sqlite:///' + FILENAME}})
+
+        self.interface = _schema.Schema.interface('searchtest')
+        self.interface.create_schema()
+        self.session = self.interface.get_session(True)
+
+        self.session.add_all([Document(id=1, title='Alpha', body='first body'),
+            Document(id=2, title='Beta', body='second body'),
+            Document(id=3, title='Alpha beta', body=None)])
+        self.session.commit()
+
+    def tearDown(self):
+        self.session.close()
+        self.interface.purge()
+        self.assembly.demote()
+        os.unlink(FILENAME)
+
+    def _match(self, criterion):
+        return sorted(id for id, in self.session.query(Document.id).filter(criterion))
+
+    def test_search_across_sources(self):
+        self.assertEqual(self._match(SearchMatch(Document.search, 'ALPHA')), [1, 3])
+        self.assertEqual(self._match(SearchMatch(Document.search, 'alpha body')), [1])
+        self.assertEqual(self._match(SearchMatch(Document.search, 'beta')), [2, 3])
+        self.assertEqual(self._match(SearchMatch(Document.search, 'gamma')), [])
+
+    def test_search_escapes_wildcards(self):
+        self.assertEqual(self._match(SearchMatch(Document.search, 'first%')), [])
+
+    def test_similar(self):
+        self.assertEqual(self._match(SimilarMatch(Document.title, 'ALPHA')), [1, 3])
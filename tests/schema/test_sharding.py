@@ -0,0 +1,105 @@
+import os
+from zlib import crc32
+
+from unittest2 import TestCase
+
+from spire.core import Assembly
+from spire.local import ContextLocals
+from spire.mesh.units import ContextLocal
+from spire import schema as _schema
+from spire.schema.sharding import ShardRouter, ShardingError
+
+URL = 'sqlite:////tmp/spire-test-shard-%(shard)s.db'
+SHARDS = {'east': {'shard': 'east'}, 'west': {'shard': 'west'}}
+
+_schema.Schema('shardtest')
+
+class ShardRouterTestCase(TestCase):
+    def setUp(self):
+        self.assembly = Assembly().promote()
+        self.assembly.configure({'schema:shardtest': {'url': URL}})
+        self.interface = _schema.Schema.interface('shardtest')
+
+    def tearDown(self):
+        ContextLocals.purge()
+        self.interface.purge()
+        self.assembly.demote()
+        for shard in SHARDS:
+            filename = '/tmp/spire-test-shard-%s.db' % shard
+            if os.path.exists(filename):
+                os.unlink(filename)
+
+    def router(self, **params):
+        return ShardRouter(schema='shardtest', shards=SHARDS, **params)
+
+class TestShardResolution(ShardRouterTestCase):
+    def test_hash_strategy(self):
+        router = self.router()
+        for key in ('alpha', 'beta', 42):
+            expected = ['east', 'west'][(crc32(str(key)) & 0xffffffff) % 2]
+            self.assertEqual(router.get_shard(key), expected)
+            self.assertEqual(router.get_tokens(key), SHARDS[expected])
+
+    def test_lookup_strategy(self):
+        router = self.router(strategy='lookup', lookup={'alpha': 'west'})
+        self.assertEqual(router.get_shard('alpha'), 'west')
+        with self.assertRaises(ShardingError):
+            router.get_shard('beta')
+
+        router.assign('beta', 'east')
+        self.assertEqual(router.get_shard('beta'), 'east')
+        with self.assertRaises(ShardingError):
+            router.assign('gamma', 'north')
+
+    def test_default_shard(self):
+        router = self.router(strategy='lookup', default_shard='east')
+        self.assertEqual(router.get_shard('alpha'), 'east')
+
+    def test_range_strategy(self):
+        router = self.router(strategy='range', ranges=[(100, 'west'), (0, 'east')])
+        self.assertEqual(router.get_shard(0), 'east')
+        self.assertEqual(router.get_shard(99), 'east')
+        self.assertEqual(router.get_shard(100), 'west')
+        with self.assertRaises(ShardingError):
+            router.get_shard(-1)
+
+    def test_unknown_shard(self):
+        router = self.router()
+        with self.assertRaises(ShardingError):
+            router.get_tokens(shard='north')
+
+    def test_context_key(self):
+        router = self.router(strategy='lookup', lookup={'alpha': 'west'})
+        with self.assertRaises(ShardingError):
+            router.get_shard()
+
+        ContextLocal.push({'tenant': 'alpha'})
+        self.assertEqual(router.get_shard(), 'west')
+
+class TestShardSessions(ShardRouterTestCase):
+    def test_sessions_bound_to_shard(self):
+        router = self.router()
+        east, west = router.get_session(shard='east'), router.get_session(shard='west')
+        self.assertIsNot(east, west)
+        self.assertIs(router.get_session(shard='east'), east)
+        self.assertTrue(str(east.bind.url).endswith('shard-east.db'))
+        self.assertTrue(str(west.bind.url).endswith('shard-west.db'))
+
+    def test_scatter(self):
+        router = self.router()
+        values = router.scatter(lambda session, shard: (shard, str(session.bind.url)),
+            timeout=5)
+
+        self.assertEqual(sorted(values), ['east', 'west'])
+        for shard, (name, url) in values.iteritems():
+            self.assertEqual(name, shard)
+            self.assertTrue(url.endswith('shard-%s.db' % shard))
+
+    def test_scatter_exception(self):
+        def function(session, shard):
+            if shard == 'west':
+                raise ValueError(shard)
+            return shard
+
+        with self.assertRaises(ValueError):
+            self.router().scatter(function, timeout=5)
@@ -0,0 +1,184 @@
+import logging
+from SocketServer import StreamRequestHandler, ThreadingTCPServer
+from threading import Lock, Thread
+from time import sleep
+
+from unittest2 import TestCase
+
+from spire.support.cache import Cache, MemoryBackend, SocketBackend
+
+class StoreHandler(StreamRequestHandler):
+    def handle(self):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+
+            command, arguments = line.split()[0], line.split()[1:]
+            data = None
+            if command in ('set', 'add'):
+                data = self.rfile.read(int(arguments[3]) + 2)[:-2]
+
+            with self.server.guard:
+                response = getattr(self, 'do_' + command)(self.server.entries, arguments,
+                    data)
+            self.wfile.write(response)
+            self.wfile.flush()
+
+    def do_add(self, entries, arguments, data):
+        if arguments[0] in entries:
+            return 'NOT_STORED\r\n'
+        entries[arguments[0]] = data
+        return 'STORED\r\n'
+
+    def do_delete(self, entries, arguments, data):
+        if entries.pop(arguments[0], None) is None:
+            return 'NOT_FOUND\r\n'
+        return 'DELETED\r\n'
+
+    def do_flush_all(self, entries, arguments, data):
+        entries.clear()
+        return 'OK\r\n'
+
+    def do_get(self, entries, arguments, data):
+        value = entries.get(arguments[0])
+        if value is None:
+            return 'END\r\n'
+        return 'VALUE %s 0 %d\r\n%s\r\nEND\r\n' % (arguments[0], len(value), value)
+
+    def do_incr(self, entries, arguments, data):
+        value = entries.get(arguments[0])
+        if value is None:
+            return 'NOT_FOUND\r\n'
+        value = entries[arguments[0]] = str(int(value) + int(arguments[1]))
+        return value + '\r\n'
+
+    def do_set(self, entries, arguments, data):
+        entries[arguments[0]] = data
+        return 'STORED\r\n'
+
+class Store(ThreadingTCPServer):
+    """A stand-in for a store speaking the memcached text protocol."""
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self):
+        ThreadingTCPServer.__init__(self, ('127.0.0.1', 0), StoreHandler)
+        self.entries = {}
+        self.guard = Lock()
+        self.thread = Thread(target=self.serve_forever, kwargs={'poll_interval': 0.01})
+        self.thread.daemon = True
+        self.thread.start()
+
+    @property
+    def address(self):
+        return '%s:%d' % self.server_address
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+class TestMemoryBackend(TestCase):
+    def test_least_recently_used_evicted(self):
+        cache = Cache(MemoryBackend, 2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+
+        cache.set('c', 3)
+        self.assertEqual((cache.get('a'), cache.get('b'), cache.get('c')), (1, None, 3))
+
+    def test_expiration(self):
+        cache = Cache(MemoryBackend, 2)
+        cache.set('a', 1, 0.01)
+        sleep(0.02)
+        self.assertIsNone(cache.get('a'))
+
+    def test_generations(self):
+        cache = Cache(MemoryBackend, 1)
+        generation = cache.get_generation('namespace')
+        self.assertEqual(cache.get_generation('namespace'), generation)
+
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.advance_generation('namespace'), generation + 1)
+
+class TestSocketBackend(TestCase):
+    def setUp(self):
+        self.store = Store()
+        self.cache = Cache(SocketBackend, 16, self.store.address)
+
+    def tearDown(self):
+        self.store.stop()
+
+    def test_values(self):
+        cache = self.cache
+        self.assertIsNone(cache.get('a'))
+
+        cache.set('a', {'value': [1, 'two']})
+        self.assertEqual(cache.get('a'), {'value': [1, 'two']})
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+        cache.delete('a')
+        self.assertIsNone(cache.get('a'))
+
+    def test_values_containing_delimiters(self):
+        self.cache.set('a', 'first\r\nVALUE x 0 1\r\nEND\r\n')
+        self.assertEqual(self.cache.get('a'), 'first\r\nVALUE x 0 1\r\nEND\r\n')
+
+    def test_clear(self):
+        self.cache.set('a', 1)
+        self.cache.clear()
+        self.assertIsNone(self.cache.get('a'))
+
+    def test_generations(self):
+        cache = self.cache
+        generation = cache.get_generation('namespace')
+        self.assertEqual(cache.get_generation('namespace'), generation)
+        self.assertEqual(cache.advance_generation('namespace'), generation + 1)
+        self.assertEqual(cache.get_generation('namespace'), generation + 1)
+
+    def test_evicted_generation(self):
+        cache = self.cache
+        generation = cache.advance_generation('namespace')
+        generation = cache.advance_generation('namespace')
+
+        # the store may evict a counter, which is then reseeded rather than restarted,
+        # so that it never returns to a generation which entries may be cached under
+        self.store.entries.clear()
+        self.assertGreater(cache.get_generation('namespace'), generation)
+
+        evicted = cache.get_generation('namespace')
+        self.store.entries.clear()
+        self.assertGreater(cache.advance_generation('namespace'), evicted)
+
+    def test_generation_reseeded_elsewhere(self):
+        cache, other = self.cache, Cache(SocketBackend, 16, self.store.address)
+        generation = other.advance_generation('namespace')
+
+        # this process finds the counter missing, but another reseeds it first
+        hits = [0]
+        def execute(command, retrieval=False):
+            if command.startswith('incr') and not hits[0]:
+                hits[0] += 1
+                return 'NOT_FOUND'
+            return SocketBackend._execute(cache.backend, command, retrieval)
+
+        cache.backend._execute = execute
+        self.assertEqual(cache.advance_generation('namespace'), generation + 1)
+        self.assertEqual(other.get_generation('namespace'), generation + 1)
+
+    def test_unavailable_store(self):
+        self.store.stop()
+        logger = logging.getLogger('spire.support.cache')
+        logger.disabled = True
+        try:
+            cache = Cache(SocketBackend, 16, self.store.address)
+            self.assertIsNone(cache.get('a'))
+            cache.set('a', 1)
+            cache.delete('a')
+            self.assertEqual(cache.stats()['misses'], 1)
+        finally:
+            logger.disabled = False
@@ -0,0 +1,133 @@
+from copy import deepcopy
+from threading import Event, Lock, Thread
+from time import sleep
+
+from unittest2 import TestCase
+
+from spire.support.coalescing import BatchLoader, SingleFlight
+
+class Callers(object):
+    def __init__(self):
+        self.guard = Lock()
+        self.results = []
+        self.threads = []
+
+    def start(self, function, *args):
+        def call():
+            try:
+                result = function(*args)
+            except Exception, exception:
+                result = exception
+            with self.guard:
+                self.results.append(result)
+
+        thread = Thread(target=call)
+        self.threads.append(thread)
+        thread.start()
+
+    def join(self):
+        for thread in self.threads:
+            thread.join(5)
+        return self.results
+
+class TestSingleFlight(TestCase):
+    def test_concurrent_calls_coalesced(self):
+        flight, started, release, calls = SingleFlight(deepcopy), Event(), Event(), []
+        def function(value):
+            calls.append(value)
+            started.set()
+            release.wait(5)
+            return {'value': value}
+
+        callers = Callers()
+        callers.start(flight.call, 'key', function, 1)
+        self.assertTrue(started.wait(5))
+        for i in range(3):
+            callers.start(flight.call, 'key', function, 2)
+
+        sleep(0.1)
+        release.set()
+        results = callers.join()
+
+        self.assertEqual(calls, [1])
+        self.assertEqual(results, [{'value': 1}] * 4)
+        self.assertEqual(len(set(id(result) for result in results)), 4)
+        self.assertEqual(flight.calls, {})
+
+    def test_distinct_keys_not_coalesced(self):
+        flight, calls = SingleFlight(), []
+        for key in ('a', 'b', 'a'):
+            self.assertEqual(flight.call(key, lambda: calls.append(key) or key), key)
+        self.assertEqual(calls, ['a', 'b', 'a'])
+
+    def test_exception_shared(self):
+        flight, started, release = SingleFlight(), Event(), Event()
+        def function():
+            started.set()
+            release.wait(5)
+            raise ValueError('failed')
+
+        callers = Callers()
+        callers.start(flight.call, 'key', function)
+        self.assertTrue(started.wait(5))
+        callers.start(flight.call, 'key', function)
+
+        sleep(0.1)
+        release.set()
+        results = callers.join()
+
+        self.assertEqual(len(results), 2)
+        for result in results:
+            self.assertIsInstance(result, ValueError)
+
+class TestBatchLoader(TestCase):
+    def _load(self, keys):
+        with self.guard:
+            self.batches.append(sorted(keys))
+        return dict((key, {'key': key}) for key in keys)
+
+    def setUp(self):
+        self.batches = []
+        self.guard = Lock()
+
+    def _wait_for_keys(self, loader, count):
+        for i in range(500):
+            batch = loader.batches.get(None)
+            if batch and len(batch.keys) == count:
+                return
+            sleep(0.01)
+
+    def test_keys_batched(self):
+        loader, callers = BatchLoader(5, 3, deepcopy), Callers()
+        callers.start(loader.get, 'a', self._load)
+        self._wait_for_keys(loader, 1)
+        callers.start(loader.get, 'a', self._load)
+        callers.start(loader.get, 'b', self._load)
+        self._wait_for_keys(loader, 2)
+
+        sleep(0.1)
+        callers.start(loader.get, 'c', self._load)
+        results = callers.join()
+
+        self.assertEqual(self.batches, [['a', 'b', 'c']])
+        self.assertEqual(sorted(result['key'] for result in results), ['a', 'a', 'b', 'c'])
+        self.assertEqual(len(set(id(result) for result in results)), 4)
+        self.assertEqual(loader.batches, {})
+
+    def test_window(self):
+        loader = BatchLoader(0.01, 100)
+        self.assertEqual(loader.get('a', self._load), {'key': 'a'})
+        self.assertEqual(loader.get('b', self._load), {'key': 'b'})
+        self.assertEqual(self.batches, [['a'], ['b']])
+
+    def test_contexts_batched_apart(self):
+        loader, callers = BatchLoader(5, 2), Callers()
+        for key, context in (('a', 1), ('b', 2), ('c', 1), ('d', 2)):
+            callers.start(loader.get, key, self._load, context)
+
+        callers.join()
+        self.assertEqual(sorted(self.batches), [['a', 'c'], ['b', 'd']])
+
+    def test_missing_key(self):
+        loader = BatchLoader(0.01, 100)
+        self.assertIsNone(loader.get('a', lambda keys: {}))
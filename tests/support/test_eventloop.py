@@ -0,0 +1,82 @@
+from threading import Event
+from time import sleep
+
+from unittest2 import TestCase, skipUnless
+
+from spire.support.eventloop import CoroutineTimeout, EventLoop, asyncio
+
+@skipUnless(EventLoop.supported, 'neither asyncio nor trollius is available')
+class TestEventLoop(TestCase):
+    def setUp(self):
+        self.eventloop = EventLoop()
+
+    def tearDown(self):
+        self.eventloop.stop()
+
+    def test_submit_coroutine(self):
+        @asyncio.coroutine
+        def add(a, b):
+            yield asyncio.From(asyncio.sleep(0.01))
+            raise asyncio.Return(a + b)
+
+        result = self.eventloop.submit_coroutine(add(1, 2))
+        self.assertEqual(result.result(5), 3)
+
+    def test_coroutine_exception(self):
+        @asyncio.coroutine
+        def fail():
+            yield asyncio.From(asyncio.sleep(0))
+            raise KeyError('fail')
+
+        result = self.eventloop.submit_coroutine(fail())
+        with self.assertRaises(KeyError):
+            result.result(5)
+
+    def test_coroutine_timeout(self):
+        release = Event()
+
+        @asyncio.coroutine
+        def wait():
+            while not release.is_set():
+                yield asyncio.From(asyncio.sleep(0.01))
+
+        result = self.eventloop.submit_coroutine(wait())
+        with self.assertRaises(CoroutineTimeout):
+            result.result(0.05)
+
+        release.set()
+        self.assertIsNone(result.result(5))
+
+    def test_run_in_pool(self):
+        eventloop = self.eventloop
+
+        @asyncio.coroutine
+        def blocking():
+            first = yield asyncio.From(eventloop.run_in_pool(sleep, 0.01))
+            second = yield asyncio.From(eventloop.run_in_pool(lambda a, b: a * b, 3, b=4))
+            raise asyncio.Return((first, second))
+
+        result = eventloop.submit_coroutine(blocking())
+        self.assertEqual(result.result(5), (None, 12))
+
+    def test_run_in_pool_exception(self):
+        eventloop = self.eventloop
+
+        def fail():
+            raise ValueError('fail')
+
+        @asyncio.coroutine
+        def blocking():
+            try:
+                yield asyncio.From(eventloop.run_in_pool(fail))
+            except ValueError:
+                raise asyncio.Return('caught')
+
+        result = eventloop.submit_coroutine(blocking())
+        self.assertEqual(result.result(5), 'caught')
+
+    def test_reset_after_fork(self):
+        loop = self.eventloop._acquire_loop()
+        self.eventloop._reset_after_fork()
+        self.assertIsNot(self.eventloop._acquire_loop(), loop)
+        loop.call_soon_threadsafe(loop.stop)
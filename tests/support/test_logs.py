@@ -0,0 +1,230 @@
+import json
+import logging
+import os
+from tempfile import mkstemp
+
+from unittest2 import TestCase
+
+import spire.support.logs
+from spire.support.logs import *
+
+class Collector(logging.Handler):
+    def __init__(self, formatter=None):
+        logging.Handler.__init__(self)
+        self.lines = []
+        if formatter:
+            self.setFormatter(formatter)
+
+    def emit(self, record):
+        self.lines.append(self.format(record))
+
+class LoggingTestCase(TestCase):
+    def setUp(self):
+        self.logger = logging.getLogger('tests.support.test_logs')
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.handlers = list(self.logger.handlers)
+        LogHelper.invalidate()
+
+    def tearDown(self):
+        self.logger.handlers = self.handlers
+        LogHelper.invalidate()
+
+    def collect(self, formatter=None):
+        collector = Collector(formatter)
+        self.logger.handlers = [collector]
+        return collector
+
+class TestLogHelper(LoggingTestCase):
+    def test_cached_levels(self):
+        log = LogHelper(self.logger)
+        self.assertFalse(log.enabled('debug'))
+        self.assertTrue(log.enabled('info'))
+
+        self.logger.setLevel(logging.DEBUG)
+        self.assertFalse(log.enabled('debug'))
+
+        LogHelper.invalidate()
+        self.assertTrue(log.enabled('debug'))
+
+    def test_lazy_arguments(self):
+        collector, calls = self.collect(), []
+        def expensive():
+            calls.append(1)
+            return 'value'
+
+        log = LogHelper(self.logger)
+        log('debug', 'message %s', lazy(expensive))
+        self.assertEqual(calls, [])
+
+        log('info', 'message %s', lazy(expensive))
+        self.assertEqual(collector.lines, ['message value'])
+        self.assertEqual(calls, [1])
+
+    def test_unicode_lazy_arguments(self):
+        collector = self.collect()
+        log = LogHelper(self.logger)
+
+        log('info', 'message %s', lazy(lambda: u'caf\xe9'))
+        log('info', u'message %s', lazy(lambda: u'caf\xe9'))
+        self.assertEqual(collector.lines, ['message caf\xc3\xa9', u'message caf\xe9'])
+
+    def test_structured_messages(self):
+        collector = self.collect()
+        log = LogHelper(self.logger)
+
+        log('info', 'request %s', 'get', path='/', status=200)
+        self.assertEqual(collector.lines, ['request get path=/ status=200'])
+
+    def test_disabled_structured_messages(self):
+        collector, messages = self.collect(), []
+        class CountedMessage(StructuredMessage):
+            def __init__(self, *args):
+                messages.append(args)
+                StructuredMessage.__init__(self, *args)
+
+        spire.support.logs.StructuredMessage = CountedMessage
+        try:
+            LogHelper(self.logger)('debug', 'request %s', 'get', status=200)
+        finally:
+            spire.support.logs.StructuredMessage = StructuredMessage
+
+        self.assertEqual(messages, [])
+        self.assertEqual(collector.lines, [])
+
+class TestFormatters(LoggingTestCase):
+    def test_log_formatter(self):
+        collector = self.collect(LogFormatter())
+        self.logger.info('message')
+
+        timestamp, name, level, message = collector.lines[0].split(' ')
+        self.assertRegexpMatches(timestamp, r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}Z$')
+        self.assertEqual((name, level, message), (self.logger.name, 'INFO', 'message'))
+
+    def test_json_formatter(self):
+        collector = self.collect(JsonFormatter())
+        LogHelper(self.logger)('info', 'request %s', 'get', status=200)
+        self.logger.info('plain %s', lazy(lambda: u'caf\xe9'))
+
+        structured, plain = [json.loads(line) for line in collector.lines]
+        self.assertEqual(structured['message'], 'request get')
+        self.assertEqual(structured['level'], 'INFO')
+        self.assertEqual(structured['fields'], {'status': 200})
+        self.assertEqual(plain['message'], u'plain caf\xe9')
+        self.assertNotIn('fields', plain)
+
+    def test_json_formatter_reserved_fields(self):
+        collector = self.collect(JsonFormatter())
+        LogHelper(self.logger)('info', 'message', name='field', exception='field',
+            timestamp='field', value=lazy(lambda: u'caf\xe9'))
+
+        entry = json.loads(collector.lines[0])
+        self.assertEqual(entry['name'], self.logger.name)
+        self.assertNotIn('exception', entry)
+        self.assertNotEqual(entry['timestamp'], 'field')
+        self.assertEqual(entry['fields'], {'name': 'field', 'exception': 'field',
+            'timestamp': 'field', 'value': u'caf\xe9'})
+
+    def test_json_formatter_exception(self):
+        collector = self.collect(JsonFormatter())
+        try:
+            raise ValueError('failure')
+        except ValueError:
+            LogHelper(self.logger)('exception', 'failed')
+
+        entry = json.loads(collector.lines[0])
+        self.assertEqual(entry['level'], 'ERROR')
+        self.assertIn('ValueError: failure', entry['exception'])
+
+class TestQueueHandler(LoggingTestCase):
+    def tearDown(self):
+        stop_queue_handlers()
+        super(TestQueueHandler, self).tearDown()
+
+    def queue(self, formatter=None):
+        collector = Collector(formatter)
+        handler = QueueHandler(collector)
+        self.logger.handlers = [handler]
+        return handler, collector
+
+    def test_records_written_by_listener(self):
+        handler, collector = self.queue()
+        for i in range(3):
+            self.logger.info('message %d', i)
+
+        handler.close()
+        self.assertEqual(collector.lines, ['message 0', 'message 1', 'message 2'])
+
+    def test_arguments_captured_when_logged(self):
+        handler, collector = self.queue(JsonFormatter())
+        items = ['first']
+        self.logger.info('items %s', items)
+        LogHelper(self.logger)('info', 'fields', items=items, count=1)
+        items.append('second')
+
+        handler.close()
+        plain, structured = [json.loads(line) for line in collector.lines]
+        self.assertEqual(plain['message'], "items ['first']")
+        self.assertEqual(structured['fields'], {'items': "['first']", 'count': 1})
+
+    def _write_to_file(self, messages, encoding=None):
+        descriptor, filename = mkstemp()
+        os.close(descriptor)
+        try:
+            handler = QueueHandler(logging.FileHandler(filename, encoding=encoding))
+            self.logger.handlers = [handler]
+            for message in messages:
+                self.logger.info(message)
+
+            handler.close()
+            with open(filename, 'rb') as openfile:
+                return openfile.read()
+        finally:
+            os.unlink(filename)
+
+    def test_non_ascii_messages_written_to_file(self):
+        content = self._write_to_file([u'caf\xe9', 'caf\xc3\xa9', 'plain'])
+        self.assertEqual(content, 'caf\xc3\xa9\ncaf\xc3\xa9\nplain\n')
+
+    def test_non_ascii_messages_written_to_encoded_file(self):
+        content = self._write_to_file([u'caf\xe9', 'plain'], 'utf8')
+        self.assertEqual(content, 'caf\xc3\xa9\nplain\n')
+
+    def test_unwritable_message_does_not_lose_batch(self):
+        logging.raiseExceptions = False
+        try:
+            content = self._write_to_file(['first', u'caf\xe9', 'last'], 'ascii')
+        finally:
+            logging.raiseExceptions = True
+        self.assertEqual(content, 'first\nlast\n')
+
+    def test_closed_handler_ignores_records(self):
+        handler, collector = self.queue()
+        handler.close()
+
+        self.logger.info('message')
+        self.assertEqual(collector.lines, [])
+
+    def test_configure_logging_stops_queue_handlers(self):
+        configuration = {
+            'disable_existing_loggers': False,
+            'handlers': {'null': {'class': 'logging.NullHandler'}},
+            'loggers': {self.logger.name: {'handlers': ['null'], 'propagate': False}},
+            'queue': {'size': 100},
+        }
+
+        for i in range(3):
+            configure_logging(dict(configuration))
+        self.assertEqual(len([handler for handler in self.logger.handlers
+            if isinstance(handler, QueueHandler)]), 1)
+        self.assertEqual(len(spire.support.logs.QUEUE_HANDLERS), 1)
+
+    def test_restart_replaces_held_locks(self):
+        handler, collector = self.queue()
+        collector.acquire()
+        handler.acquire()
+
+        restart_queue_handlers()
+        self.logger.info('message')
+        handler.close()
+        self.assertEqual(collector.lines, ['message'])
@@ -0,0 +1,119 @@
+import os
+from time import sleep, time
+
+from unittest2 import TestCase
+
+from spire.core import Assembly
+from spire.runtime.runtime import Runtime
+from spire.support.processpool import ProcessPool, get_shared_buffer
+
+def read_buffer(name, size):
+    return get_shared_buffer(name)[:size]
+
+class WriteBuffer(object):
+    def __init__(self, name, value):
+        self.name = name
+        self.value = value
+
+    def __call__(self):
+        get_shared_buffer(self.name)[:len(self.value)] = self.value
+
+def wait_for(condition, timeout=5.0):
+    limit = time() + timeout
+    while not condition():
+        if time() > limit:
+            raise AssertionError('condition not met within %s seconds' % timeout)
+        sleep(0.01)
+
+class ProcessPoolTestCase(TestCase):
+    def setUp(self):
+        self.pools = []
+
+    def tearDown(self):
+        for pool in self.pools:
+            pool.close()
+
+    def pool(self, **params):
+        params.setdefault('processes', 1)
+        pool = ProcessPool(**params)
+        self.pools.append(pool)
+        return pool
+
+class TestProcessPool(ProcessPoolTestCase):
+    def test_submit(self):
+        pool = self.pool()
+        self.assertEqual(pool.submit(pow, 2, 3).get(5), 8)
+        self.assertNotEqual(pool.submit(os.getpid).get(5), os.getpid())
+
+    def test_enqueue(self):
+        pool = self.pool(buffers={'shared': 8})
+        pool.enqueue(WriteBuffer('shared', 'written'))
+
+        shared = get_shared_buffer('shared')
+        wait_for(lambda: shared[:7] == 'written')
+
+    def test_unpicklable_package(self):
+        pool = self.pool()
+        with self.assertRaises(ValueError):
+            pool.enqueue(lambda: None)
+        self.assertIsNone(pool.pool)
+
+    def test_shared_buffer(self):
+        pool = self.pool(buffers={'shared': 8})
+        self.assertEqual(pool.submit(read_buffer, 'shared', 3).get(5), '\x00' * 3)
+
+        pool.buffers['shared'][:3] = 'abc'
+        self.assertEqual(pool.submit(read_buffer, 'shared', 3).get(5), 'abc')
+
+    def test_maximum_tasks(self):
+        pool = self.pool(maximum_tasks=1)
+        first = pool.submit(os.getpid).get(5)
+        second = pool.submit(os.getpid).get(5)
+        self.assertNotEqual(first, second)
+
+    def test_reset_after_fork(self):
+        pool = self.pool(buffers={'shared': 8})
+        self.assertEqual(pool.submit(pow, 2, 2).get(5), 4)
+        previous = pool.pool
+
+        # a forked process inherits the pool without its workers, so it must be recreated
+        pool._reset_after_fork()
+        self.assertIsNone(pool.pool)
+        self.assertEqual(pool.buffers, {})
+        try:
+            self.assertEqual(pool.submit(pow, 2, 3).get(5), 8)
+            self.assertIsNot(pool.pool, previous)
+            self.assertIn('shared', pool.buffers)
+        finally:
+            previous.terminate()
+
+    def test_pool_recreated_in_other_process(self):
+        pool = self.pool()
+        pool.submit(pow, 2, 2).get(5)
+        previous = pool.pool
+
+        pool.pid = -1
+        try:
+            self.assertEqual(pool.submit(pow, 2, 3).get(5), 8)
+            self.assertIsNot(pool.pool, previous)
+        finally:
+            previous.terminate()
+
+class TestRuntimeHooks(ProcessPoolTestCase):
+    def setUp(self):
+        super(TestRuntimeHooks, self).setUp()
+        self.assembly = Assembly().promote()
+        self.runtime = Runtime()
+
+    def tearDown(self):
+        super(TestRuntimeHooks, self).tearDown()
+        Runtime.runtime = None
+        self.assembly.demote()
+
+    def test_hooks_registered(self):
+        pool = self.pool()
+        pool.submit(pow, 2, 2).get(5)
+        self.assertIn(pool._reset_after_fork, self.runtime.postforks)
+
+        self.runtime.shutdown()
+        self.assertIsNone(pool.pool)
@@ -0,0 +1,134 @@
+from threading import Event
+from time import sleep, time
+
+from unittest2 import TestCase
+
+from spire.exceptions import ConfigurationError
+from spire.support.threadpool import Histogram, PoolSaturated, ThreadPool
+
+def wait_for(condition, timeout=5.0):
+    limit = time() + timeout
+    while not condition():
+        if time() > limit:
+            raise AssertionError('condition not met within %s seconds' % timeout)
+        sleep(0.01)
+
+class TestHistogram(TestCase):
+    def test_observe(self):
+        histogram = Histogram(bounds=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(value)
+
+        description = histogram.describe()
+        self.assertEqual(description['count'], 4)
+        self.assertAlmostEqual(description['sum'], 2.65)
+        self.assertEqual(description['buckets'], [(0.1, 2), (1.0, 3), ('+Inf', 4)])
+
+class TestThreadPoolStats(TestCase):
+    def test_uninstrumented_stats(self):
+        pool = ThreadPool(maximum_threads=1)
+        stats = pool.stats()
+        self.assertEqual(stats['threads'], 0)
+        self.assertEqual(stats['pending'], 0)
+        self.assertEqual(stats['lanes'], {'default': 0})
+        self.assertNotIn('run_time', stats)
+
+    def test_deferred_packages(self):
+        pool = ThreadPool(maximum_threads=1)
+        release = Event()
+        pool.enqueue(release.wait)
+        pool.enqueue(lambda: None)
+
+        stats = pool.stats()
+        self.assertEqual(stats['threads'], 1)
+        self.assertEqual(stats['running'], 1)
+        self.assertEqual(stats['pending'], 1)
+        self.assertEqual(stats['queued'], 2)
+        self.assertEqual(stats['deferred'], 1)
+
+        release.set()
+        wait_for(lambda: pool.stats()['idle'] == 1)
+        self.assertEqual(pool.stats()['pending'], 0)
+
+    def test_instrumented_stats(self):
+        pool = ThreadPool(maximum_threads=1, instrumented=True)
+        finished = Event()
+        pool.enqueue(lambda: sleep(0.02))
+        pool.enqueue(finished.set)
+
+        finished.wait(5)
+        wait_for(lambda: pool.stats()['run_time']['count'] == 2)
+
+        stats = pool.stats()
+        self.assertEqual(stats['wait_time']['count'], 2)
+        self.assertTrue(stats['run_time']['sum'] >= 0.02)
+        self.assertTrue(stats['wait_time']['sum'] >= 0.02)
+
+    def test_saturated_pool(self):
+        pool = ThreadPool(maximum_threads=1, maximum_pending=1)
+        release = Event()
+        pool.enqueue(release.wait)
+        pool.enqueue(lambda: None)
+
+        with self.assertRaises(PoolSaturated):
+            pool.enqueue(lambda: None)
+        self.assertEqual(pool.stats()['rejected'], 1)
+        release.set()
+
+class TestThreadPoolLanes(TestCase):
+    def test_invalid_default_lane(self):
+        with self.assertRaises(ConfigurationError):
+            ThreadPool(lanes=['high', 'low'], default_lane='normal')
+
+    def test_unknown_lane(self):
+        pool = ThreadPool(lanes=['high', 'low'])
+        self.assertEqual(pool.default_lane, 'high')
+        with self.assertRaises(ValueError):
+            pool.enqueue(lambda: None, lane='normal')
+
+    def test_lane_priority(self):
+        pool = ThreadPool(lanes=['high', 'low'], default_lane='low', maximum_threads=1)
+        release, finished, order = Event(), Event(), []
+
+        pool.enqueue(release.wait)
+        pool.enqueue(lambda: order.append('low'))
+        pool.enqueue(lambda: order.append('high'), lane='high')
+        pool.enqueue(finished.set)
+        self.assertEqual(pool.stats()['lanes'], {'high': 1, 'low': 2})
+
+        release.set()
+        finished.wait(5)
+        self.assertEqual(order, ['high', 'low'])
+
+    def test_keyed_serial_execution(self):
+        pool = ThreadPool(maximum_threads=4)
+        release, order = Event(), []
+
+        def first():
+            release.wait()
+            order.append(1)
+
+        pool.enqueue(first, key='a')
+        pool.enqueue(lambda: order.append(2), key='a')
+        pool.enqueue(lambda: order.append(3), key='a')
+        pool.enqueue(lambda: order.append('b'), key='b')
+
+        wait_for(lambda: 'b' in order)
+        self.assertEqual(order, ['b'])
+        self.assertEqual(pool.stats()['waiting'], 2)
+
+        release.set()
+        wait_for(lambda: len(order) == 4)
+        self.assertEqual(order, ['b', 1, 2, 3])
+        wait_for(lambda: pool.stats()['serialized'] == 0)
+        self.assertEqual(pool.stats()['waiting'], 0)
+
+    def test_saturated_serial_key(self):
+        pool = ThreadPool(maximum_threads=1, maximum_pending=0)
+        release = Event()
+        pool.enqueue(release.wait)
+
+        with self.assertRaises(PoolSaturated):
+            pool.enqueue(lambda: None, key='a')
+        self.assertEqual(pool.stats()['serialized'], 0)
+        release.set()